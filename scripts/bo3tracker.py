@@ -4,16 +4,35 @@ import glob
 import time
 import base64
 import threading
+import multiprocessing
+if __name__ == "__main__":
+    # Pool workers re-launch this executable when frozen; hand them off before the UI imports
+    multiprocessing.freeze_support()
 import webview # pip install pywebview
 import sys
 import zipfile # --- NEW IMPORT FOR BACKUPS ---
+import copy
 from pathlib import Path
 
 # --- CUSTOM IMPORTS ---
+from startup import startup_profiler, LazySingleton, preload_in_background
 from challenge_system import ChallengeManager
 from match_xp import xp_tracker_instance
-from xpm_grapher import xpm_grapher_instance
+from xpm_grapher import xpm_grapher_instance, GRAPH_MAX_POINTS
+from xp_forecast import xp_forecast_instance, format_eta
 from workshop_images import get_workshop_image
+from live_feed import live_bus_instance
+from match_archive import (archive_path, load_archive, load_archive_file, load_archive_summary,
+                           match_journal_instance, read_json_file, set_compact_mode, migrate_folder)
+from match_index import match_index_instance, format_map_name
+from pace_reference import pace_reference_instance
+from lifetime_stats import lifetime_stats_instance
+from history_rebuild import history_rebuild_instance
+from xp_backfill import xp_backfill_instance
+from snapshot_diff import diff_snapshots
+from match_lifecycle import match_lifecycle_instance
+
+startup_profiler.mark("modules imported")
 
 # --- CONSTANTS ---
 CONFIG_FILE = "config.json"
@@ -128,10 +147,8 @@ def get_base_path():
 
 # --- FILE HELPERS ---
 def load_json(path):
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except: return None
+    # Plain or gzip-compressed (compact archive) JSON
+    return read_json_file(path)
 
 def save_json(path, data):
     try:
@@ -323,12 +340,70 @@ class DamageMemory:
             self.cache[game_id][player_id][weapon_name] = w_data
             return current_raw_val + offset
 
-# Initialize Systems
-damage_tracker = DamageMemory()
-challenge_manager = ChallengeManager(get_base_path()) 
+    def peek_real_damage(self, game_id, player_id, weapon_name, current_raw_val):
+        # Fast path for weapons whose damage did not move since the last snapshot
+        w_data = self.cache.get(game_id, {}).get(player_id, {}).get(weapon_name)
+        if w_data is None or w_data["last_seen"] != current_raw_val:
+            return self.get_real_damage(game_id, player_id, weapon_name, current_raw_val)
+        return current_raw_val + w_data["overflow_offset"]
+
+    def evict_game(self, game_id):
+        with self.lock:
+            if self.cache.pop(game_id, None) is not None:
+                self._save_to_disk()
+
+# Initialize Systems (built on first use, or by the startup preload thread)
+damage_tracker = LazySingleton("damage memory", DamageMemory)
+challenge_manager = LazySingleton("challenge manager", lambda: ChallengeManager(get_base_path()))
+
+# --- XP FORECAST ---
+def get_player_forecast(game_id, pid, p, round_history=None):
+    # Rolling-rate ETAs; only meaningful while the match is still running
+    if match_lifecycle_instance.is_finalized(game_id):
+        return None
+    if not xp_forecast_instance.has_player(game_id, pid):
+        if round_history is None:
+            round_history = xpm_grapher_instance.live_history.get(game_id, {}).get(pid) or p.get('round_history')
+        xp_forecast_instance.seed(game_id, pid, round_history)
+    return xp_forecast_instance.forecast(
+        game_id, pid, xp_tracker_instance.xp_table,
+        int(p.get('prestige', 0)), int(p.get('level', 1)), int(p.get('xp', p.get('total_xp', 0))),
+        app_config.get('xp_target_level')
+    )
+
+# --- PACE vs BEST MATCH ON THE MAP ---
+def get_player_pace(game_id, pid, game, graph_version, graph_data, round_xp_data):
+    # Reference curves are built in the background; until one is ready there is no comparison
+    hist_path = app_config.get('history_path')
+    if not hist_path or match_lifecycle_instance.is_finalized(game_id):
+        return None
+    map_name = format_map_name(game.get('map_played'))
+    chosen = (app_config.get('pace_reference') or {}).get(map_name)
+    curve = pace_reference_instance.get(hist_path, pid, map_name, chosen, exclude_game=sanitize_filename(game_id))
+    if curve is None:
+        return None
+
+    current_round = int(game.get('rounds_total', 0))
+    live_xpm = graph_data["data"][-1] if graph_data["data"] else 0
+    ref = curve.at(current_round)
+    if ref:
+        ref_xpm, ref_round_xp, ref_round_time = ref
+        mins, secs = divmod(int(ref_round_time), 60)
+        text = f"{live_xpm - ref_xpm:+,.0f} XP/min vs {ref_xpm:,.0f} | R{current_round} took {mins}:{secs:02d}"
+    else:
+        ref_xpm = ref_round_xp = ref_round_time = None
+        text = f"Past the reference's last round ({curve.last_round})"
+    xpm_data, round_xp_ref, round_time_ref = curve.aligned(
+        f"{graph_version}|{curve.game_id}" if graph_version else None, graph_data["labels"], round_xp_data["labels"]
+    )
+    return {
+        "game_id": curve.game_id, "map": map_name, "match_xp": curve.xp, "chosen": bool(chosen),
+        "round": current_round, "xpm": ref_xpm, "round_xp": ref_round_xp, "round_time": ref_round_time,
+        "text": text, "xpm_data": xpm_data, "round_xp_data": round_xp_ref, "round_time_data": round_time_ref,
+    }
 
 # --- DATA PROCESSOR (MULTI-PLAYER STATS) ---
-def process_stats(data, is_live=False):
+def process_stats(data, is_live=False, changes=None):
     if not data: return None
     
     game = data.get('game') or data.get('data', {}).get('game', {})
@@ -439,6 +514,11 @@ def process_stats(data, is_live=False):
         weapons_html = ""
         weapons = p.get('top5', p.get('weapon_data', {}))
         processed_weapons = []
+
+        # Only weapons whose damage moved need the overflow tracker; the rest reuse its last answer
+        moved_damage = None
+        if changes is not None and pid not in changes.added_players:
+            moved_damage = changes.damage_moved(pid)
         
         for k, w in weapons.items():
             if w.get('display') == 'none': continue
@@ -452,7 +532,10 @@ def process_stats(data, is_live=False):
             try: raw_damage = int(float(w.get('damage', 0)))
             except: raw_damage = 0
                 
-            corrected_damage = damage_tracker.get_real_damage(game_id, pid, k, raw_damage)
+            if moved_damage is not None and k not in moved_damage:
+                corrected_damage = damage_tracker.peek_real_damage(game_id, pid, k, raw_damage)
+            else:
+                corrected_damage = damage_tracker.get_real_damage(game_id, pid, k, raw_damage)
             
             processed_weapons.append({
                 "name": dname,
@@ -473,17 +556,32 @@ def process_stats(data, is_live=False):
         tactical = equip.get('tactical', {}).get('name', 'None').replace('_', ' ').title()
         
         # --- NEW: EXTRACT GRAPH DATA ---
-        if is_live:
-            # Grab the actively tracked history from Python memory for the live game
-            round_history = xpm_grapher_instance.live_history.get(game_id, {}).get(pid, {})
+        max_points = app_config.get('graph_max_points') or GRAPH_MAX_POINTS
+        live_graph = xpm_grapher_instance.get_graph_payloads(game_id, pid, max_points) if is_live else None
+        if live_graph:
+            # Served from the grapher's incrementally maintained series
+            graph_version, graph_data, round_xp_data, zpm_graph_data = live_graph
+            graph_version = f"{game_id}|{pid}|{graph_version}"
+            round_history = None
         else:
-            # Grab the saved history from the JSON file for archived games
-            round_history = p.get('round_history', {})
-            
-        graph_data = xpm_grapher_instance.generate_graph_data(round_history)
-        round_xp_data = xpm_grapher_instance.generate_xp_per_round_data(round_history)
-        zpm_graph_data = xpm_grapher_instance.generate_zpm_data(round_history)
+            if is_live:
+                # Finished match still on screen: its history now lives in the archive
+                round_history = get_archived_round_history(game_id, pid) if match_lifecycle_instance.is_finalized(game_id) else {}
+            else:
+                # Grab the saved history from the JSON file for archived games
+                round_history = p.get('round_history', {})
+            graph_version = None
+            graph_data, round_xp_data, zpm_graph_data = xpm_grapher_instance.query_history(round_history, max_points)
         # -------------------------------
+
+        forecast = get_player_forecast(game_id, pid, p, round_history) if is_live else None
+        eta_text = format_eta(forecast["next_level"]) if forecast else "--"
+        if forecast and forecast["target"]:
+            eta_text += f"  |  LV {forecast['target_level']}: {format_eta(forecast['target'])}"
+        pace = get_player_pace(game_id, pid, game, graph_version, graph_data, round_xp_data) if is_live else None
+        if pace and graph_version:
+            # Redraw once the reference arrives or changes
+            graph_version += f"|{pace['game_id']}"
 
         players_list.append({
             "pid": pid,
@@ -506,9 +604,15 @@ def process_stats(data, is_live=False):
             "graph_data": graph_data["data"],
             "round_xp_labels": round_xp_data["labels"],
             "round_xp_data": round_xp_data["data"],
+            "round_time_data": round_xp_data.get("round_time", []),
             "zpm_labels": zpm_graph_data["labels"],
-            "zpm_data": zpm_graph_data["data"]
+            "zpm_data": zpm_graph_data["data"],
+            "graph_version": graph_version,
             # ------------------------------
+            "forecast": forecast,
+            "eta": eta_text,
+            "pace": pace,
+            "pace_text": pace["text"] if pace else "--"
         })
 
     return {
@@ -516,6 +620,31 @@ def process_stats(data, is_live=False):
         "players": players_list
     }
 
+def get_live_snapshot():
+    """Return (version, data) for the live file from the shared snapshot bus."""
+    path = app_config.get('live_path')
+    if not path or not os.path.exists(path):
+        return 0, None
+    live_bus_instance.attach(path)
+    return live_bus_instance.get_latest()
+
+_last_stats_snapshot = None
+
+def _build_live_stats(data):
+    # Runs under the bus's per-key lock, so builds are serialized
+    global _last_stats_snapshot
+    changes = diff_snapshots(_last_stats_snapshot, data)
+    _last_stats_snapshot = data
+    return process_stats(data, is_live=True, changes=changes)
+
+def get_live_processed_stats():
+    """process_stats() for the live snapshot, computed once per version."""
+    path = app_config.get('live_path')
+    if not path or not os.path.exists(path):
+        return None
+    live_bus_instance.attach(path)
+    return live_bus_instance.get_derived("stats", _build_live_stats)
+
 # --- PROCESSOR (CAMO STATS) ---
 def process_camo_data(user_json_path):
     global CAMO_ICON_CACHE
@@ -686,14 +815,19 @@ def get_unified_overlay_html():
 
 def overlay_loop():
     global unified_window, stop_overlays
+    last_version = 0
     
     while not stop_overlays:
         if unified_window:
             path = app_config.get('live_path')
             if path and os.path.exists(path):
                 try:
-                    data = load_json(path)
-                    stats = process_stats(data, is_live=True)
+                    live_bus_instance.attach(path)
+                    version, data = live_bus_instance.wait_for_snapshot(last_version, timeout=2)
+                    if version == last_version or not data:
+                        continue
+                    last_version = version
+                    stats = get_live_processed_stats()
                     
                     if stats and stats['players']:
                         # Lock Overlay to Player 1 to save screen real estate
@@ -739,6 +873,7 @@ def overlay_loop():
                                 
                 except Exception as e:
                     print(f"Unified Overlay Error: {e}")
+                continue
         
         time.sleep(2)
 
@@ -1041,6 +1176,7 @@ def get_main_app_html():
     workshop_images_on = app_config.get('workshop_images_enabled', True)
     workshop_images_chk_str = "checked" if workshop_images_on else ""
     workshop_images_js = "true" if workshop_images_on else "false"
+    compact_archives_chk_str = "checked" if app_config.get('archive_compact_mode', False) else ""
 
     return """
     <!DOCTYPE html>
@@ -1192,6 +1328,13 @@ def get_main_app_html():
                                         </div>
                                     </div>
                                 <div class="detail-row"><span>MULTIPLIER</span><span id="d_mult" style="color:var(--highlight)">x1.0</span></div>
+                                <div class="detail-row"><span>NEXT LEVEL</span><span id="d_eta" style="color:#66fcf1">--</span></div>
+                                <div class="detail-row"><span>PACE vs BEST</span><span id="d_pace" style="color:#66fcf1">--</span></div>
+                                <div class="detail-row"><span>PACE REFERENCE</span>
+                                    <select id="pace-ref-select" onfocus="loadPaceReferences()" onchange="choosePaceReference(this.value)" style="background:#111; color:#aaa; border:1px solid #444; font-size:0.85em; max-width:60%;">
+                                        <option value="">Best on map</option>
+                                    </select>
+                                </div>
                                 <div class="detail-row"><span>GOBBLEGUMS</span><span id="d_gums" style="color:#d400ff">0</span></div>
                             </div>
                         </div>
@@ -1381,6 +1524,10 @@ def get_main_app_html():
                         <button class="nav-btn-small" style="background:var(--danger); margin-left:10px;" onclick="resetOps()">RESET</button>
                     </div>
                 </div>
+                <div id="history-rebuild-status" style="display:none; justify-content:space-between; align-items:center; gap:15px; padding:8px 12px; margin-bottom:10px; border-left:3px solid var(--accent); background:rgba(0,0,0,0.18); font-size:0.8em; color:#aaa;">
+                    <span id="history-rebuild-text">SYNCING MATCH HISTORY...</span>
+                    <button class="nav-btn-small" onclick="window.pywebview.api.cancel_history_rebuild()">CANCEL</button>
+                </div>
                 <div id="challenge-list" class="chal-grid"></div>
             </div>
 
@@ -1441,6 +1588,28 @@ def get_main_app_html():
                     </div>
                 </div>
 
+                <div class="card">
+                    <div class="card-title">HISTORY STORAGE</div>
+                    <div style="display:flex; justify-content:space-between; align-items:center; gap:15px;">
+                        <div>
+                            <div style="color:#fff; font-weight:bold;">Compact Match Archives</div>
+                            <div style="color:#aaa; font-size:0.8em;">Stores new match archives as compressed JSON. Both formats can be read at any time.</div>
+                        </div>
+                        <label class="switch">
+                            <input type="checkbox" id="compact-archives-toggle" onchange="toggleCompactArchives(this)" """ + compact_archives_chk_str + """>
+                            <span class="slider"></span>
+                        </label>
+                    </div>
+                    <div style="display:flex; justify-content:space-between; align-items:center; gap:15px; margin-top:12px;">
+                        <div id="archive-migration-status" style="color:#aaa; font-size:0.8em;">Convert existing archives to the selected format.</div>
+                        <button class="nav-btn-small" onclick="migrateArchives()">CONVERT HISTORY</button>
+                    </div>
+                    <div style="display:flex; justify-content:space-between; align-items:center; gap:15px; margin-top:12px;">
+                        <div id="xp-backfill-status" style="color:#aaa; font-size:0.8em;">Estimate Match XP for old archives from the level change between consecutive matches.</div>
+                        <button class="nav-btn-small" onclick="backfillMatchXp()">BACKFILL MATCH XP</button>
+                    </div>
+                </div>
+
                 <div class="card">
                     <div class="card-title">OVERLAY CONTROL</div>
                     <div style="display:flex; justify-content:space-between; align-items:center; gap:15px;">
@@ -1533,6 +1702,13 @@ def get_main_app_html():
         let currentRoundXpData = [];   // Stores the new Round XP values
         let currentZpmLabels = [];
         let currentZpmData = [];
+        let currentGraphVersion = null; // "game|player|version" of the series on screen
+        let currentPaceXpmData = [];     // Reference match XPM at each XPM label
+        let currentPaceRoundXpData = []; // Reference match round XP at each round XP label
+        let currentRoundTimeData = [];      // Seconds each round took, at each round XP label
+        let currentPaceRoundTimeData = [];  // Reference match round seconds at each round XP label
+        let currentPacePid = '0';
+        let currentPaceMap = null;
         let zpmOverlayEnabled = false;
         let currentThemeName = 'default';
         let workshopImagesEnabled = """ + workshop_images_js + """;
@@ -1682,6 +1858,71 @@ def get_main_app_html():
                 if (existingIndex >= 0) xpmChartInstance.data.datasets.splice(existingIndex, 1);
                 xpmChartInstance.options.scales.zpmAxis.display = false;
             }
+            syncPaceDataset(xpmChartInstance, currentPaceXpmData);
+        }
+
+        // Dashed line for the best past match on this map, aligned by round
+        function syncPaceDataset(chart, data) {
+            if (!chart) return;
+            const existingIndex = chart.data.datasets.findIndex(d => d.id === 'pace-overlay');
+            if (!data.length) {
+                if (existingIndex >= 0) chart.data.datasets.splice(existingIndex, 1);
+                return;
+            }
+            const paceDataset = {
+                id: 'pace-overlay', type: 'line', label: 'Best On Map',
+                data: data, borderColor: 'rgba(255, 255, 255, 0.55)', borderDash: [6, 4],
+                borderWidth: 2, fill: false, tension: 0.2, pointRadius: 0, spanGaps: true
+            };
+            if (existingIndex >= 0) {
+                chart.data.datasets[existingIndex] = paceDataset;
+            } else {
+                chart.data.datasets.push(paceDataset);
+            }
+        }
+
+        // Round XP chart extras while a reference is set: reference round XP, and round time for both matches
+        function syncRoundXpOverlays() {
+            const chart = roundXpChartInstance;
+            if (!chart) return;
+            syncPaceDataset(chart, currentPaceRoundXpData);
+            const showTime = currentPaceRoundTimeData.length > 0;
+            const timeDatasets = [
+                { id: 'round-time', type: 'line', label: 'Round Time (s)', data: currentRoundTimeData,
+                  borderColor: '#ff9d00', borderWidth: 2, fill: false, tension: 0.2, pointRadius: 0, yAxisID: 'timeAxis' },
+                { id: 'pace-time', type: 'line', label: 'Best On Map Round Time (s)', data: currentPaceRoundTimeData,
+                  borderColor: 'rgba(255, 157, 0, 0.55)', borderDash: [6, 4], borderWidth: 2, fill: false, tension: 0.2,
+                  pointRadius: 0, spanGaps: true, yAxisID: 'timeAxis' }
+            ];
+            timeDatasets.forEach(ds => {
+                const existingIndex = chart.data.datasets.findIndex(d => d.id === ds.id);
+                if (showTime) {
+                    if (existingIndex >= 0) chart.data.datasets[existingIndex] = ds; else chart.data.datasets.push(ds);
+                } else if (existingIndex >= 0) {
+                    chart.data.datasets.splice(existingIndex, 1);
+                }
+            });
+            chart.options.scales.timeAxis.display = showTime;
+        }
+
+        async function loadPaceReferences() {
+            const sel = document.getElementById('pace-ref-select');
+            const res = await window.pywebview.api.get_pace_references(currentPacePid);
+            if (!sel || !res || res.error) return;
+            currentPaceMap = res.map;
+            const options = ['<option value="">Best on map</option>'];
+            (res.matches || []).forEach(m => {
+                const mins = Math.floor((m.time_total || 0) / 60);
+                const chosen = m.game_id === res.selected ? ' selected' : '';
+                options.push(`<option value="${escapeHtml(m.game_id)}"${chosen}>${m.xp.toLocaleString()} XP | R${m.rounds} | ${mins}m</option>`);
+            });
+            sel.innerHTML = options.join('');
+        }
+
+        async function choosePaceReference(gameId) {
+            if (!currentPaceMap) return;
+            await window.pywebview.api.set_pace_reference(currentPaceMap, gameId || null);
+            currentGraphVersion = null; // Redraw with the new reference once it is built
         }
 
         function sizeGraphCanvas(canvas, wrapper, labelCount) {
@@ -1857,6 +2098,7 @@ def get_main_app_html():
             if (roundXpChartInstance) {
                 roundXpChartInstance.data.labels = currentRoundXpLabels;
                 roundXpChartInstance.data.datasets[0].data = currentRoundXpData;
+                syncRoundXpOverlays();
                 roundXpChartInstance.resize();
                 roundXpChartInstance.update('none'); 
                 return;
@@ -1885,10 +2127,13 @@ def get_main_app_html():
                     },
                     scales: { 
                         y: { beginAtZero: true, grid: { color: '#333' }, ticks: { color: '#aaa' }, title: { display: true, text: 'XP Gained', color: '#888' }},
+                        timeAxis: { display: false, position: 'right', beginAtZero: true, grid: { drawOnChartArea: false }, ticks: { color: '#ff9d00' }, title: { display: true, text: 'Seconds per Round', color: '#ff9d00' }},
                         x: { grid: { display: false }, ticks: { color: '#aaa' }, title: { display: true, text: 'Round', color: '#888' }}
                     }
                 }
             });
+            syncRoundXpOverlays();
+            roundXpChartInstance.update('none');
         }
 
         function renderZpmChart() {
@@ -2008,6 +2253,47 @@ def get_main_app_html():
                 window.pywebview.api.toggle_workshop_images(checkbox.checked);
             }
 
+            function toggleCompactArchives(checkbox) {
+                window.pywebview.api.toggle_compact_archives(checkbox.checked);
+            }
+
+            async function migrateArchives() {
+                const statusEl = document.getElementById('archive-migration-status');
+                const compact = document.getElementById('compact-archives-toggle').checked;
+                const res = await window.pywebview.api.migrate_match_archives(compact);
+                if (!res.success) {
+                    statusEl.innerText = res.msg;
+                    return;
+                }
+                const poll = setInterval(async () => {
+                    const st = await window.pywebview.api.get_archive_migration_status();
+                    if (st.running) {
+                        statusEl.innerText = `Converting ${st.done} / ${st.total}...`;
+                        return;
+                    }
+                    clearInterval(poll);
+                    statusEl.innerText = st.msg || "Done.";
+                }, 1000);
+            }
+
+            async function backfillMatchXp() {
+                const statusEl = document.getElementById('xp-backfill-status');
+                const res = await window.pywebview.api.backfill_match_xp();
+                if (!res.success) {
+                    statusEl.innerText = res.msg;
+                    return;
+                }
+                const poll = setInterval(async () => {
+                    const st = await window.pywebview.api.get_xp_backfill_status();
+                    if (st.running) {
+                        statusEl.innerText = st.phase === 'writing' ? `Writing ${st.done} / ${st.total}...` : `Scanning ${st.total} archive(s)...`;
+                        return;
+                    }
+                    clearInterval(poll);
+                    statusEl.innerText = st.msg || "Done.";
+                }, 1000);
+            }
+
             function escapeHtml(value) {
                 return String(value ?? '').replace(/[&<>"']/g, ch => ({
                     '&': '&amp;',
@@ -2355,6 +2641,23 @@ def get_main_app_html():
                 `;
             }
 
+            async function watchHistoryRebuild() {
+                const box = document.getElementById('history-rebuild-status');
+                const text = document.getElementById('history-rebuild-text');
+                const poll = setInterval(async () => {
+                    const st = await window.pywebview.api.get_history_rebuild_status();
+                    if (st.running) {
+                        box.style.display = 'flex';
+                        text.innerText = st.total ? `SYNCING MATCH HISTORY ${st.done} / ${st.total}` : "SYNCING MATCH HISTORY...";
+                        return;
+                    }
+                    clearInterval(poll);
+                    box.style.display = 'none';
+                    const chalTab = document.getElementById('tab-challenges');
+                    if (chalTab && chalTab.classList.contains('active')) loadChallenges();
+                }, 1000);
+            }
+
             async function resetOps() {
                 if(confirm("Are you sure you want to reset all challenge progress? This cannot be undone.")) {
                     await window.pywebview.api.reset_challenges_api();
@@ -2525,7 +2828,7 @@ document.getElementById('life_fav_gun').innerHTML = favGunsText;
 
         let html = '<div style="display: flex; flex-direction: column;">';
         topMaps.forEach(entry => {
-            html += `<div style="display:flex; justify-content:space-between; align-items:center; border-bottom:1px solid #333; padding:10px 5px; flex-shrink:0; min-height:25px;">
+            html += `<div style="display:flex; justify-content:space-between; align-items:center; border-bottom:1px solid #333; padding:10px 5px; flex-shrink:0; min-height:25px; cursor:pointer;" title="Open record match" onclick="loadHistory('${escapeHtml(entry.game_id)}', null)">
                 <span style="white-space:nowrap; overflow:hidden; text-overflow:ellipsis; padding-right:15px; color:#ddd;">${entry.map}</span>
                 <span style="color:var(--highlight); font-weight:bold; white-space:nowrap;">${entry.xp.toLocaleString()} XP</span>
             </div>`;
@@ -2539,11 +2842,7 @@ document.getElementById('life_fav_gun').innerHTML = favGunsText;
 }
             
             async function init() {
-                updateSidebar();
-                switchTab('live');
-                
-                await window.pywebview.api.force_sync_challenges();
-                
+                // Theme first, so the window never paints unstyled while stores load
                 const savedTheme = await window.pywebview.api.get_active_theme();
                 currentThemeName = savedTheme || 'default';
                 if (savedTheme && savedTheme !== 'default') {
@@ -2552,6 +2851,13 @@ document.getElementById('life_fav_gun').innerHTML = favGunsText;
                 }
                 applyGraphTheme();
                 
+                updateSidebar();
+                switchTab('live');
+                window.pywebview.api.report_ui_ready();
+                
+                // Rebuild runs in the background; the UI stays responsive meanwhile
+                if (await window.pywebview.api.force_sync_challenges()) watchHistoryRebuild();
+                
                 setInterval(async () => {
                     if (isLive) {
                         try {
@@ -2746,6 +3052,9 @@ document.getElementById('life_fav_gun').innerHTML = favGunsText;
                 setTxt('d_gums', p.gums);
                 setTxt('d_xp', p.xp);
                 setTxt('d_mult', p.mult);
+                setTxt('d_eta', p.eta || '--');
+                setTxt('d_pace', p.pace_text || '--');
+                currentPacePid = p.pid;
                 setTxt('d_kills', p.k);
                 setTxt('d_score', p.pts);
                 setTxt('d_acc', p.acc);
@@ -2758,12 +3067,19 @@ document.getElementById('life_fav_gun').innerHTML = favGunsText;
                 setHtml('d_weaps', p.weaps);
 
                // --- NEW GRAPH DATA BINDING ---
+                // Unchanged live series: keep the charts as they are
+                if (p.graph_version && p.graph_version === currentGraphVersion) return;
+                currentGraphVersion = p.graph_version || null;
                 currentGraphLabels = p.graph_labels || [];
                 currentGraphData = p.graph_data || [];
                 currentRoundXpLabels = p.round_xp_labels || [];
                 currentRoundXpData = p.round_xp_data || [];
                 currentZpmLabels = p.zpm_labels || [];
                 currentZpmData = p.zpm_data || [];
+                currentPaceXpmData = (p.pace && p.pace.xpm_data) || [];
+                currentPaceRoundXpData = (p.pace && p.pace.round_xp_data) || [];
+                currentRoundTimeData = p.round_time_data || [];
+                currentPaceRoundTimeData = (p.pace && p.pace.round_time_data) || [];
                 
                 const graphContainer = document.getElementById('xpm-graph-container');
                 const roundXpContainer = document.getElementById('roundxp-graph-container');
@@ -3230,7 +3546,7 @@ class TrackerAPI:
         if not raw_id or raw_id == "0":
             if not live_path or not os.path.exists(live_path):
                 return {"success": False, "msg": "No displayed match ID is available, and Live Game Path is not configured."}
-            live_data = load_json(live_path)
+            _, live_data = get_live_snapshot()
             if not live_data:
                 return {"success": False, "msg": "CurrentGame.json could not be read."}
             live_game = live_data.get('game') or live_data.get('data', {}).get('game', {})
@@ -3243,7 +3559,7 @@ class TrackerAPI:
         safe_id = sanitize_filename(raw_id)
         archive_path = os.path.join(hist_path, f"Game_{safe_id}.json")
         if os.path.exists(archive_path):
-            archive_data = load_json(archive_path)
+            archive_data = load_archive_summary(archive_path)
         else:
             archive_data = live_data
 
@@ -3277,7 +3593,7 @@ class TrackerAPI:
             if hist_path and game_id:
                 archive_path = os.path.join(hist_path, f"Game_{game_id}.json")
                 if os.path.exists(archive_path):
-                    archive_data = load_json(archive_path)
+                    archive_data = load_archive_summary(archive_path)
                     if archive_data:
                         fallback_date = result.get("date", "")
                         result = get_game_summary(archive_data, fallback_id=game_id, fallback_date=fallback_date)
@@ -3313,62 +3629,152 @@ class TrackerAPI:
         if not hist_path or not os.path.exists(hist_path): 
             return {"items": [], "total_pages": 0, "current_page": 1}
             
-        json_files = glob.glob(os.path.join(hist_path, "Game_*.json"))
-        json_files.sort(key=os.path.getmtime, reverse=True)
+        # Served from the SQLite match index; only new/changed archives get parsed
+        try:
+            match_index_instance.ensure_synced(hist_path)
+            total_items = match_index_instance.count(hist_path)
+        except Exception as e:
+            print(f"Match index error: {e}")
+            return {"items": [], "total_pages": 0, "current_page": 1}
         
         items_per_page = 50
-        total_items = len(json_files)
         total_pages = max(1, math.ceil(total_items / items_per_page))
         
         # Ensure page stays within valid bounds
         page = max(1, min(int(page), total_pages))
         start_idx = (page - 1) * items_per_page
-        end_idx = start_idx + items_per_page
         
         results = []
-        for f in json_files[start_idx:end_idx]: 
-            fname = os.path.basename(f)
-            gid = fname.replace("Game_", "").replace(".json", "")
-            
-            mtime = os.path.getmtime(f)
-            dt = time.localtime(mtime)
+        for row in match_index_instance.page(hist_path, start_idx, items_per_page):
+            dt = time.localtime(row['mtime'])
             date_str = time.strftime("%b %d, %Y %I:%M %p", dt) 
             
             map_name = "Unknown Map"
-            try:
-                with open(f, 'r', encoding='utf-8') as jf:
-                    d = json.load(jf)
-                    game = d.get('game') or d.get('data', {}).get('game', {})
-                    map_val = game.get('map_played')
-                    if map_val:
-                        map_name = str(map_val).replace('_', ' ').title()
-            except: pass
+            if row['map']:
+                map_name = str(row['map']).replace('_', ' ').title()
             
-            results.append({"id": gid, "map": map_name, "date": date_str})
+            results.append({"id": row['game_id'], "map": map_name, "date": date_str})
             
         return {"items": results, "total_pages": total_pages, "current_page": page}
     
     def get_live_stats(self):
-        path = app_config.get('live_path')
-        if not path or not os.path.exists(path): return None
-        data = load_json(path)
-        return process_stats(data, is_live=True)
+        return get_live_processed_stats()
+
+    def get_match_status(self):
+        return match_lifecycle_instance.get_status()
+
+    def get_xp_forecast(self):
+        _, data = get_live_snapshot()
+        if not data:
+            return {"error": "No live game"}
+        game = data.get('game') or data.get('data', {}).get('game', {})
+        players = data.get('players') or data.get('data', {}).get('players', {})
+        game_id = str(game.get('game_id', 'unknown_match'))
+        return {
+            pid: get_player_forecast(game_id, pid, p) for pid, p in players.items()
+        }
+
+    def set_xp_target_level(self, level):
+        global app_config
+        try:
+            app_config['xp_target_level'] = int(level) if level else None
+        except (TypeError, ValueError):
+            return False
+        save_json(os.path.join(get_base_path(), CONFIG_FILE), app_config)
+        return True
+
+    def get_graph_window(self, game_id, player_id, round_from=None, round_to=None, max_points=None):
+        """Graph payloads for a round range (zooming), downsampled to max_points."""
+        game_id, player_id = str(game_id), str(player_id)
+        try:
+            round_from = int(round_from) if round_from not in (None, "") else None
+            round_to = int(round_to) if round_to not in (None, "") else None
+            max_points = int(max_points) if max_points else (app_config.get('graph_max_points') or GRAPH_MAX_POINTS)
+        except (TypeError, ValueError):
+            return {"error": "Invalid range"}
+        live = xpm_grapher_instance.get_graph_payloads(game_id, player_id, max_points, round_from, round_to)
+        if live:
+            version, xpm, round_xp, zpm = live
+            version = f"{game_id}|{player_id}|{version}|{round_from}-{round_to}"
+        else:
+            version = None
+            xpm, round_xp, zpm = xpm_grapher_instance.query_history(
+                get_archived_round_history(game_id, player_id), max_points, round_from, round_to
+            )
+        return {
+            "graph_labels": xpm["labels"], "graph_data": xpm["data"],
+            "round_xp_labels": round_xp["labels"], "round_xp_data": round_xp["data"],
+            "round_time_data": round_xp.get("round_time", []),
+            "zpm_labels": zpm["labels"], "zpm_data": zpm["data"],
+            "graph_version": version,
+        }
+
+    def get_round_metrics(self, game_id, player_id, round_from=None, round_to=None):
+        """Round length, rolling XPM, XP per zombie and round-over-round change as parallel lists."""
+        game_id, player_id = str(game_id), str(player_id)
+        try:
+            round_from = int(round_from) if round_from not in (None, "") else None
+            round_to = int(round_to) if round_to not in (None, "") else None
+        except (TypeError, ValueError):
+            return {"error": "Invalid range"}
+        metrics = xpm_grapher_instance.get_metrics(game_id, player_id, round_from, round_to)
+        if metrics is None:
+            metrics = xpm_grapher_instance.metrics_from_history(
+                get_archived_round_history(game_id, player_id), round_from, round_to
+            )
+        return metrics
+
+    def get_pace_references(self, player_id="0"):
+        """Archived matches on the live map that can be the pace reference, best first."""
+        hist_path = app_config.get('history_path')
+        _, data = get_live_snapshot()
+        if not hist_path or not data:
+            return {"error": "No live game"}
+        game = data.get('game') or data.get('data', {}).get('game', {})
+        map_name = format_map_name(game.get('map_played'))
+        try:
+            match_index_instance.ensure_synced(hist_path)
+            rows = match_index_instance.map_matches(hist_path, str(player_id), map_name, 20)
+        except Exception as e:
+            print(f"Match index error: {e}")
+            rows = []
+        return {
+            "map": map_name,
+            "selected": (app_config.get('pace_reference') or {}).get(map_name),
+            "matches": [r for r in rows if r["game_id"] != sanitize_filename(game.get('game_id', ''))],
+        }
+
+    def set_pace_reference(self, map_name, game_id=None):
+        """Compare the map against a specific archived match; an empty game_id goes back to the record match."""
+        global app_config
+        map_name = format_map_name(map_name)
+        choices = dict(app_config.get('pace_reference') or {})
+        if game_id:
+            choices[map_name] = str(game_id)
+        else:
+            choices.pop(map_name, None)
+        app_config['pace_reference'] = choices
+        save_json(os.path.join(get_base_path(), CONFIG_FILE), app_config)
+        pace_reference_instance.invalidate()
+        return True
 
     def get_career_level_info(self):
         live_path = app_config.get('live_path')
         data = None
         if live_path and os.path.exists(live_path):
-            data = load_json(live_path)
+            _, data = get_live_snapshot()
         if not data:
             hist_path = app_config.get('history_path')
             if hist_path and os.path.exists(hist_path):
-                game_files = sorted(
-                    [f for f in os.listdir(hist_path) if f.startswith("Game_") and f.endswith(".json")],
-                    key=lambda f: os.path.getmtime(os.path.join(hist_path, f)),
-                    reverse=True
-                )
-                if game_files:
-                    data = load_json(os.path.join(hist_path, game_files[0]))
+                # Newest archive from the match index; only its summary header is read
+                try:
+                    match_index_instance.ensure_synced(hist_path)
+                    latest = match_index_instance.latest(hist_path)
+                except Exception as e:
+                    print(f"Match index error: {e}")
+                    latest = None
+                if latest:
+                    data = load_archive_summary(archive_path(hist_path, latest['game_id']))
         if not data:
             return {"error": "No game data available"}
         game = data.get('game') or data.get('data', {}).get('game', {})
@@ -3383,7 +3789,7 @@ class TrackerAPI:
         title = p.get('title', '')
         map_name = game.get('map_played', 'Unknown')
         steam_link = game.get('steam_link', '')
-        xp_required = xp_tracker_instance.get_xp_required(level)
+        xp_required = xp_tracker_instance.get_xp_required(level, prestige)
         if ult > 0:
             rank_main = "ULTIMATE PRESTIGE"
         elif abso > 0:
@@ -3425,9 +3831,23 @@ class TrackerAPI:
         hist_path = app_config.get('history_path')
         target = os.path.join(hist_path, "Game_" + game_id + ".json")
         if not os.path.exists(target): return {"status": "ERROR"}
-        data = load_json(target)
+        data = load_archive_file(target)
         return process_stats(data, is_live=False)
 
+    def compact_match_archives(self):
+        hist_path = app_config.get('history_path')
+        if not hist_path or not os.path.exists(hist_path):
+            return {"success": False, "msg": "History folder is not configured or available."}
+        count = match_journal_instance.compact_all(hist_path)
+        return {"success": True, "msg": f"Compacted {count} match journal(s)."}
+
+    def rebuild_lifetime_stats(self):
+        hist_path = app_config.get('history_path')
+        if not hist_path or not os.path.exists(hist_path):
+            return {"success": False, "msg": "History folder is not configured or available."}
+        count = lifetime_stats_instance.rebuild(hist_path)
+        return {"success": True, "msg": f"Rebuilt career stats from {count} match archive(s)."}
+
     def get_workshop_image(self, steam_link_id):
         if not app_config.get('workshop_images_enabled', True):
             return None
@@ -3439,6 +3859,40 @@ class TrackerAPI:
         save_json(os.path.join(get_base_path(), CONFIG_FILE), app_config)
         return True
 
+    def toggle_compact_archives(self, enabled):
+        global app_config
+        app_config['archive_compact_mode'] = bool(enabled)
+        save_json(os.path.join(get_base_path(), CONFIG_FILE), app_config)
+        set_compact_mode(enabled)
+        return True
+
+    def migrate_match_archives(self, compact=True):
+        hist_path = app_config.get('history_path')
+        if not hist_path or not os.path.exists(hist_path):
+            return {"success": False, "msg": "History folder is not configured or available."}
+        if archive_migration_state["running"]:
+            return {"success": False, "msg": "A conversion is already running."}
+        archive_migration_state.update({"running": True, "done": 0, "total": 0, "report": None, "msg": ""})
+        t = threading.Thread(target=run_archive_migration, args=(hist_path, bool(compact)), daemon=True)
+        t.start()
+        return {"success": True}
+
+    def get_archive_migration_status(self):
+        return dict(archive_migration_state)
+
+    def backfill_match_xp(self):
+        hist_path = app_config.get('history_path')
+        if not hist_path or not os.path.exists(hist_path):
+            return {"success": False, "msg": "History folder is not configured or available."}
+        started = xp_backfill_instance.start(hist_path, xp_tracker_instance.xp_table, match_journal_instance, match_index_instance)
+        return {"success": started, "msg": "" if started else "A backfill is already running."}
+
+    def get_xp_backfill_status(self):
+        return xp_backfill_instance.get_status()
+
+    def cancel_xp_backfill(self):
+        return xp_backfill_instance.cancel()
+
     def toggle_overlay_system(self, enabled):
         global app_config
         app_config['overlays_enabled'] = enabled
@@ -3455,77 +3909,34 @@ class TrackerAPI:
         t.start()
         return True
 
+    def get_xp_cache_stats(self):
+        return xp_tracker_instance.get_persistence_stats()
+
     def get_lifetime_stats(self):
         hist_path = app_config.get('history_path')
         if not hist_path or not os.path.exists(hist_path): 
             return {"error": "No History Folder Found"}
 
-        totals = {
-            "kills": 0, "headshots": 0, "downs": 0, "rounds": 0, 
-            "time_sec": 0, "matches": 0, "doors": 0, "gums": 0,
-            "box": 0,
-            "pts": 0
-        }
-        weapon_stats = {} 
-        map_high_rounds = {}
-        map_play_counts = {}
-        map_play_times = {}
-
-        json_files = glob.glob(os.path.join(hist_path, "Game_*.json"))
-        
-        # 1. ADD UP ALL THE HISTORY FIRST
-        for f in json_files:
-            try:
-                data = load_json(f)
-                if not data: continue
-                
-                game = data.get('game') or data.get('data', {}).get('game', {})
-                players = data.get('players') or data.get('data', {}).get('players', {})
-                if not players: continue
-                
-                # Career Stats are locked to Player '0' (The Host/Local Player)
-                p = list(players.values())[0]
-
-                totals["matches"] += 1
-                totals["kills"] += int(p.get('kills', 0))
-                totals["headshots"] += int(p.get('headshots', 0))
-                totals["downs"] += int(p.get('downs', 0))
-                totals["rounds"] += int(game.get('rounds_total', 0))
-                totals["time_sec"] += int(game.get('time_total', 0))
-                totals["doors"] += int(p.get('doors_purchased', 0))
-                totals["gums"] += int(p.get('gobblegums_used', 0))
-                
-                # Simple Addition of the custom tracked stats
-                totals["box"] += int(p.get('true_match_box', 0))
-                totals["pts"] += int(p.get('true_match_points', 0))
-
-                map_name = str(game.get('map_played', 'Unknown')).replace('_', ' ').title()
-                rnd = int(game.get('rounds_total', 0))
-                if map_name not in map_high_rounds or rnd > map_high_rounds[map_name]:
-                    map_high_rounds[map_name] = rnd
-                    
-                if map_name not in map_play_counts:
-                    map_play_counts[map_name] = 0
-                map_play_counts[map_name] += 1
-                
-                if map_name not in map_play_times:
-                    map_play_times[map_name] = 0
-                map_play_times[map_name] += int(game.get('time_total', 0))
-
-                w_data = p.get('weapon_data', p.get('top5', {}))
-                for k, w in w_data.items():
-                    name = w.get('display', 'Unknown')
-                    if name == "none" or name == "Unknown": continue
-                    if name not in weapon_stats: weapon_stats[name] = 0
-                    weapon_stats[name] += int(w.get('kills', 0))
-
-            except Exception: pass
+        # 1. CAREER AGGREGATES (maintained per finalized match, no folder scan)
+        overlay_id, overlay_data = None, None
+        status = match_lifecycle_instance.get_status()
+        if status.get('game_id') and status.get('state') != 'ended':
+            # The match in progress has not been folded in yet; count its archive as it stands
+            overlay_id = sanitize_filename(status['game_id'])
+            overlay_data = load_archive(hist_path, overlay_id)
+        try:
+            lifetime_stats_instance.ensure_synced(hist_path)
+            totals, weapon_stats, map_high_rounds, map_play_counts, map_play_times = \
+                lifetime_stats_instance.get_view(hist_path, overlay_id, overlay_data)
+        except Exception as e:
+            print(f"Lifetime stats error: {e}")
+            return {"error": "Lifetime stats unavailable"}
         
         # --- 2. OVERRIDE SELECTED LOGISTICS WITH LIVE GAME ---
         live_path = app_config.get('live_path')
         if live_path and os.path.exists(live_path):
             try:
-                live_data = load_json(live_path)
+                _, live_data = get_live_snapshot()
                 if live_data:
                     live_players = live_data.get('players') or live_data.get('data', {}).get('players', {})
                     if live_players:
@@ -3599,12 +4010,23 @@ class TrackerAPI:
     def get_active_theme(self):
         return app_config.get('active_theme', 'default')
         
+    def report_ui_ready(self):
+        finish_startup_step("ui ready")
+        return True
+
     def force_sync_challenges(self):
+        # Parallel rebuild in the background; poll get_history_rebuild_status()
         hist_path = app_config.get('history_path')
-        if hist_path:
-            challenge_manager.scan_all_history(hist_path)
+        if hist_path and os.path.exists(hist_path):
+            history_rebuild_instance.start(hist_path, challenge_manager, lifetime_stats_instance, match_index_instance)
             return True
         return False
+
+    def get_history_rebuild_status(self):
+        return history_rebuild_instance.get_status()
+
+    def cancel_history_rebuild(self):
+        return history_rebuild_instance.cancel()
         
     def get_available_themes(self):
         theme_path = os.path.join(get_base_path(), THEMES_DIR)
@@ -3649,7 +4071,7 @@ class TrackerAPI:
         live_data = None
         if live_path and os.path.exists(live_path):
             try:
-                live_data = load_json(live_path)
+                _, live_data = get_live_snapshot()
             except: pass
             
         challenge_manager.reset_all_challenges(live_data)
@@ -3678,49 +4100,18 @@ class TrackerAPI:
         return app_config.get('active_card', 'default')
 
     def get_top_10_xp_maps(self, player_id="0"):
-        import glob
-        import os
-        
-        xp_cache_path = os.path.join(get_base_path(), "match_xp_cache.json")
-        xp_data = load_json(xp_cache_path) or {}
-        
         hist_path = app_config.get('history_path')
         if not hist_path or not os.path.exists(hist_path):
             return []
 
-        map_highest_xp = {}
-
-        for filepath in glob.glob(os.path.join(hist_path, "Game_*.json")):
-            match_data = load_json(filepath)
-            if not match_data:
-                continue
-                
-            game = match_data.get('game') or match_data.get('data', {}).get('game', {})
-            players = match_data.get('players') or match_data.get('data', {}).get('players', {})
-            
-            game_id = str(game.get('game_id', ''))
-            map_name = str(game.get('map_played', 'Unknown')).replace('_', ' ').title()
-
-            match_xp = 0
-            
-            # 1. Try to get XP from the live cache first
-            if game_id in xp_data and str(player_id) in xp_data[game_id]:
-                match_xp = xp_data[game_id][str(player_id)].get('total_match_xp', 0)
-            
-            # 2. Fallback: If not in cache, check the archived history file directly!
-            elif str(player_id) in players:
-                p_data = players[str(player_id)]
-                # Safely get the match_xp_earned if it exists in the archive
-                match_xp = int(p_data.get('match_xp_earned', 0))
-
-            # 3. Only track maps where XP is greater than 0
-            if match_xp > 0:
-                if map_name not in map_highest_xp or match_xp > map_highest_xp[map_name]:
-                    map_highest_xp[map_name] = match_xp
-
-        # Sort and return the top 10
-        sorted_maps = sorted(map_highest_xp.items(), key=lambda x: x[1], reverse=True)
-        return [{"map": m[0], "xp": m[1]} for m in sorted_maps[:10]]
+        # Per-player best XP per map is kept in the match index as matches are saved
+        try:
+            match_index_instance.ensure_synced(hist_path)
+            rows = match_index_instance.top_xp_maps(hist_path, player_id, 10)
+        except Exception as e:
+            print(f"Match index error: {e}")
+            return []
+        return [{"map": r['map'], "xp": r['xp'], "game_id": r['game_id']} for r in rows]
         
         # Add this new method to your API class
     def get_xp_per_round_graph(self, game_id, player_id):
@@ -3730,9 +4121,85 @@ class TrackerAPI:
         # Use our new method to generate the dataset
         return xpm_grapher_instance.generate_xp_per_round_data(history)
 
+# --- ARCHIVE MIGRATION ---
+archive_migration_state = {"running": False, "done": 0, "total": 0, "report": None, "msg": ""}
+
+def run_archive_migration(hist_path, compact):
+    def progress(done, total):
+        archive_migration_state["done"] = done
+        archive_migration_state["total"] = total
+    try:
+        report = migrate_folder(hist_path, compact=compact, journal=match_journal_instance, progress=progress)
+        # Sizes changed; let the index pick that up without re-parsing later
+        match_index_instance.sync_folder(hist_path)
+        archive_migration_state["report"] = report
+        archive_migration_state["msg"] = (
+            f"Converted {report['converted']} of {report['files']} archive(s). "
+            f"Size {report['bytes_before'] / 1048576:.1f} MB -> {report['bytes_after'] / 1048576:.1f} MB, "
+            f"read time {report['read_seconds_before']:.2f}s -> {report['read_seconds_after']:.2f}s."
+        )
+    except Exception as e:
+        archive_migration_state["msg"] = f"Conversion failed: {e}"
+    finally:
+        archive_migration_state["running"] = False
+
+# --- MATCH LIFECYCLE HOOKS ---
+def get_archived_round_history(game_id, player_id):
+    hist_path = app_config.get('history_path')
+    if not hist_path:
+        return {}
+    data = load_archive(hist_path, sanitize_filename(game_id)) or {}
+    players = data.get('players') or data.get('data', {}).get('players', {})
+    return players.get(player_id, {}).get('round_history', {}) if players else {}
+
+def on_match_started(game_id, info):
+    # A match we already finalized (or saw in a previous session) is back:
+    # restore its XP baseline and graph so match XP does not restart from zero
+    hist_path = info.get('history_path')
+    if not hist_path or xp_tracker_instance.has_game(game_id):
+        return
+    data = load_archive(hist_path, sanitize_filename(game_id))
+    if not data:
+        return
+    players = data.get('players') or data.get('data', {}).get('players', {})
+    for pid, p in (players or {}).items():
+        if 'match_xp_earned' not in p:
+            continue
+        xp_tracker_instance.seed_player(
+            game_id, pid, int(p.get('prestige', 0)), int(p.get('level', 1)),
+            int(p.get('xp', p.get('total_xp', 0))), int(p['match_xp_earned'])
+        )
+        xpm_grapher_instance.restore_history(game_id, pid, p.get('round_history'))
+
+def on_match_finalized(game_id, info):
+    hist_path = info.get('history_path')
+    if hist_path and os.path.exists(hist_path):
+        safe_id = sanitize_filename(game_id)
+        match_journal_instance.compact(hist_path, safe_id)
+        try:
+            match_index_instance.upsert(hist_path, archive_path(hist_path, safe_id))
+        except Exception as e:
+            print(f"Match index error: {e}")
+        try:
+            lifetime_stats_instance.record_archive(hist_path, archive_path(hist_path, safe_id))
+        except Exception as e:
+            print(f"Lifetime stats error: {e}")
+        # Settles the match's final counters; rescans only if one went backwards
+        challenge_manager.apply_game(load_archive(hist_path, safe_id), hist_path)
+    xp_tracker_instance.evict_game(game_id)
+    damage_tracker.evict_game(game_id)
+    xpm_grapher_instance.evict_game(game_id)
+    xp_forecast_instance.evict_game(game_id)
+    # The finished match may be the new record on its map
+    pace_reference_instance.invalidate()
+
+match_lifecycle_instance.add_listener("on_match_started", on_match_started)
+match_lifecycle_instance.add_listener("on_match_finalized", on_match_finalized)
+
 # --- LIVE BACKGROUND LOGIC (MULTI-PLAYER) ---
 def monitor_game():
-    last_saved_data_str = ""  
+    last_raw_snapshot = None
+    last_match_xp = {}
     last_game_id = None
     known_active_perks = {} 
     session_perk_count = {} 
@@ -3744,6 +4211,11 @@ def monitor_game():
     session_match_box = {}
     session_last_raw_box = {}
 
+    last_version = 0
+    journals_checked_for = None
+    # (history path, archive id, snapshot) whose journal write failed; retried until it lands
+    pending_record = None
+
     while True:
         live_path = app_config.get('live_path')
         hist_path = app_config.get('history_path')
@@ -3751,18 +4223,51 @@ def monitor_game():
         if not live_path or not hist_path: 
             time.sleep(5)
             continue
+
+        # Fold journals left behind by a previous session into their archives
+        if journals_checked_for != hist_path and os.path.exists(hist_path):
+            journals_checked_for = hist_path
+            try:
+                match_journal_instance.compact_all(hist_path)
+            except Exception:
+                pass
+
+        # Block until the shared bus publishes a new version of CurrentGame.json
+        live_bus_instance.attach(live_path)
+        version, snapshot = live_bus_instance.wait_for_snapshot(last_version, timeout=5)
+
+        # No new snapshot: retry the last one that failed to reach the journal (e.g. file locked),
+        # before the lifecycle tick can finalize the match without it
+        if pending_record and version == last_version:
+            try:
+                p_hist, p_id, p_snapshot = pending_record
+                recorded = match_journal_instance.record(p_hist, p_id, p_snapshot)
+                if recorded is not False:
+                    pending_record = None
+                if recorded:
+                    match_index_instance.upsert(p_hist, archive_path(p_hist, p_id), data=p_snapshot)
+            except Exception:
+                pass
+        match_lifecycle_instance.tick()
             
         try:
-            if os.path.exists(live_path):
-                current_data = load_json(live_path)
+            if version != last_version:
+                last_version = version
+                changes = diff_snapshots(last_raw_snapshot, snapshot)
+                last_raw_snapshot = snapshot
+                # Bus snapshots are shared read-only; we enrich our own copy below
+                current_data = copy.deepcopy(snapshot) if snapshot else None
                 
                 if current_data:
                     game = current_data.get('game') or current_data.get('data', {}).get('game', {})
                     raw_id = str(game.get('game_id', '0'))
                     
                     if raw_id and raw_id != "0":
+                        # Finalizes the previous match when the game ID changes
+                        match_lifecycle_instance.observe(raw_id, history_path=hist_path)
                         if raw_id != last_game_id:
                             last_game_id = raw_id
+                            last_match_xp = {}
                             known_active_perks = {}
                             session_perk_count = {}
                             
@@ -3823,42 +4328,49 @@ def monitor_game():
                                 p['true_match_box'] = session_match_box[pid]
 
                         # --- SAVE LOGIC ---
-                        current_data_str = json.dumps(current_data, sort_keys=True)
-                        if current_data_str != last_saved_data_str:
+                        if not changes.is_empty():
                             safe_id = sanitize_filename(raw_id)
                             if os.path.exists(hist_path):
-                                target_file = os.path.join(hist_path, f"Game_{safe_id}.json")
-                                
                                 game_info = current_data.get('game') or current_data.get('data', {}).get('game', {})
                                 g_id = str(game_info.get('game_id', 'unknown'))
                                 p_dict = current_data.get('players') or current_data.get('data', {}).get('players', {})
                                 
                                 for pid_key, p_data in p_dict.items():
-                                    p_prest = int(p_data.get('prestige', 0))
-                                    p_lvl = int(p_data.get('level', 1))
-                                    p_xp = int(p_data.get('xp', p_data.get('total_xp', 0)))
-                                    p_data['match_xp_earned'] = xp_tracker_instance.calculate_match_xp(g_id, pid_key, p_prest, p_lvl, p_xp)
-                                    # --- NEW: UPDATE & INJECT XPM HISTORY ---
-                                    current_round = int(game_info.get('rounds_total', 0))
-                                    current_time = int(game_info.get('time_total', 0))
-                                    try:
-                                        current_zpm = float(game_info.get('zpm', 0))
-                                    except:
-                                        current_zpm = 0
-                                    map_name = game_info.get('map_played', 'Unknown')
-                                    xp_debug_snapshot = xp_tracker_instance.get_last_debug_snapshot(g_id, pid_key)
-                                    record_xp_debug(xp_debug_snapshot, current_round, current_time, map_name)
-                                    p_data['round_history'] = xpm_grapher_instance.update_live_data(
-                                        g_id, pid_key, current_round, current_time, p_data['match_xp_earned'], current_zpm
-                                    )
+                                    # XP tracker only runs when this player's xp/level/prestige moved
+                                    xp_moved = changes.xp_changed(pid_key) or pid_key not in last_match_xp
+                                    if xp_moved:
+                                        p_prest = int(p_data.get('prestige', 0))
+                                        p_lvl = int(p_data.get('level', 1))
+                                        p_xp = int(p_data.get('xp', p_data.get('total_xp', 0)))
+                                        last_match_xp[pid_key] = xp_tracker_instance.calculate_match_xp(g_id, pid_key, p_prest, p_lvl, p_xp)
+                                    p_data['match_xp_earned'] = last_match_xp[pid_key]
+                                    # --- NEW: UPDATE & INJECT XPM HISTORY ---
+                                    current_round = int(game_info.get('rounds_total', 0))
+                                    current_time = int(game_info.get('time_total', 0))
+                                    try:
+                                        current_zpm = float(game_info.get('zpm', 0))
+                                    except:
+                                        current_zpm = 0
+                                    map_name = game_info.get('map_played', 'Unknown')
+                                    if xp_moved or changes.game_changed('rounds_total'):
+                                        xp_debug_snapshot = xp_tracker_instance.get_last_debug_snapshot(g_id, pid_key)
+                                        record_xp_debug(xp_debug_snapshot, current_round, current_time, map_name)
+                                    # Copy: the journal keeps this document as its delta baseline
+                                    p_data['round_history'] = dict(xpm_grapher_instance.update_live_data(
+                                        g_id, pid_key, current_round, current_time, p_data['match_xp_earned'], current_zpm
+                                    ))
+                                    xp_forecast_instance.update(g_id, pid_key, current_round, current_time, p_data['match_xp_earned'])
                                 
-                                if save_json(target_file, current_data):
-                                    last_saved_data_str = current_data_str
-                                    challenge_manager.process_update(hist_path)
+                                recorded = match_journal_instance.record(hist_path, safe_id, current_data)
+                                # None means nothing changed; only a failed write is retried
+                                pending_record = (hist_path, safe_id, current_data) if recorded is False else None
+                                if recorded:
+                                    match_index_instance.upsert(hist_path, archive_path(hist_path, safe_id), data=current_data)
+                                # Only this match's delta reaches the challenges; full rescans are explicit
+                                if changes.first_player_counters_changed():
+                                    challenge_manager.apply_game(current_data, save=False)
         except Exception:
             pass
-        
-        time.sleep(2)
 
 def get_entry_point_html():
     if not app_config or not app_config.get('live_path'):
@@ -3868,25 +4380,53 @@ def get_entry_point_html():
 def on_closed():
     toggle_overlays_logic(False)
     toggle_xp_debugger_logic(False)
+    # os._exit skips atexit, so flush write-behind state first
+    if xp_tracker_instance.is_loaded():
+        xp_tracker_instance.flush()
+    if xpm_grapher_instance.is_loaded():
+        xpm_grapher_instance.flush()
     os._exit(0)
 
+# --- STARTUP ---
+startup_report_requested = False
+startup_pending = {"ui ready", "stores loaded"}
+startup_pending_lock = threading.Lock()
+
+def finish_startup_step(step):
+    with startup_pending_lock:
+        if step not in startup_pending: return
+        startup_pending.discard(step)
+        done = not startup_pending
+    startup_profiler.mark(step)
+    if done and startup_report_requested:
+        print(startup_profiler.report())
+
 def startup_checks():
+    startup_profiler.mark("webview started")
     if app_config.get('overlays_enabled', False):
         toggle_overlays_logic(True)
     if app_config.get('xp_debugger_enabled', False):
         toggle_xp_debugger_logic(True)
 
 if __name__ == "__main__":
-    config_path = os.path.join(get_base_path(), CONFIG_FILE)
-    if os.path.exists(config_path):
-        app_config = load_json(config_path) or {}
+    startup_report_requested = "--startup-report" in sys.argv
+    with startup_profiler.phase("load config"):
+        config_path = os.path.join(get_base_path(), CONFIG_FILE)
+        if os.path.exists(config_path):
+            app_config = load_json(config_path) or {}
+        set_compact_mode(app_config.get('archive_compact_mode', False))
+    
+    # Disk-backed stores load off the UI path; first use blocks only until they are ready
+    preload_in_background(challenge_manager, xp_tracker_instance, xpm_grapher_instance, damage_tracker,
+                          on_done=lambda: finish_startup_step("stores loaded"))
     
     t = threading.Thread(target=monitor_game)
     t.daemon = True
     t.start()
     
     api = TrackerAPI()
-    window = webview.create_window('BO3 Tracker & Camo Matrix', html=get_entry_point_html(), width=1300, height=900, background_color='#0b0c10', js_api=api)
+    with startup_profiler.phase("build window"):
+        window = webview.create_window('BO3 Tracker & Camo Matrix', html=get_entry_point_html(), width=1300, height=900, background_color='#0b0c10', js_api=api)
     
     window.events.closed += on_closed
     webview.start(func=startup_checks)
@@ -0,0 +1,184 @@
+"""
+challenge_rules.py - Declarative stat extractors for challenges.
+
+A challenge's "stat" is an extractor expression over the match document.
+Expressions are compiled once into closures; compile_rules() returns one
+evaluator that turns a match into { expression: value } for every rule.
+
+Supported expressions:
+    kills, headshots, doors, round, points, melee, perks_drank,
+    rounds_added, matches        the original built-in stats
+    equipment_kills, gobblegums, downs, zpm
+    player.<field>               numeric field of the first player
+    game.<field>                 numeric field of the game block
+    a|b                          first alternative that is present
+    weapon_kills:<name>          kills with a weapon (display name or key)
+    weapon_headshots:<name>      headshots with a weapon
+    time_to_round:<N>            seconds of game time when round N began
+                                 (0 if the match never reached it)
+    const:<n>                    a fixed number
+"""
+
+ALIASES = {
+    "kills": "player.kills",
+    "headshots": "player.headshots",
+    "doors": "player.doors_purchased",
+    "round": "game.rounds_total",
+    "rounds_added": "game.rounds_total",
+    "points": "player.player_points_gained|player.points",
+    "melee": "player.melee_kills",
+    "matches": "const:1",
+    "equipment_kills": "player.equipment_kills",
+    "gobblegums": "player.gobblegums_used",
+    "downs": "player.downs",
+    "zpm": "game.zpm",
+}
+
+BUILTIN_STATS = ("matches", "kills", "headshots", "doors", "round", "points", "melee", "perks_drank", "rounds_added")
+
+# Stats that only count once per match and must not be reduced by a mid-match reset offset
+PER_MATCH_STATS = ("matches",)
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+class MatchContext:
+    """One match document, unpacked once and shared by every rule."""
+
+    def __init__(self, game_data):
+        self.data = game_data or {}
+        self.game = self.data.get('game') or self.data.get('data', {}).get('game', {}) or {}
+        players = self.data.get('players') or self.data.get('data', {}).get('players', {}) or {}
+        self.player = list(players.values())[0] if players else None
+        self._weapons = None
+        self._round_starts = None
+
+    def weapons(self):
+        """{ lowercase display name or key: (kills, headshots) }"""
+        if self._weapons is None:
+            table = {}
+            w_data = (self.player or {}).get('weapon_data', (self.player or {}).get('top5', {})) or {}
+            for key, w in w_data.items():
+                if not isinstance(w, dict): continue
+                kills = _number(w.get('kills', 0)) or 0
+                headshots = _number(w.get('headshots', 0)) or 0
+                for name in set([str(key).lower(), str(w.get('display', '')).lower()]):
+                    if not name or name == 'none': continue
+                    k, h = table.get(name, (0, 0))
+                    table[name] = (k + kills, h + headshots)
+            self._weapons = table
+        return self._weapons
+
+    def round_starts(self):
+        """{ round: game time when it began }, from the last sample of the previous round."""
+        if self._round_starts is None:
+            history = (self.player or {}).get('round_history') or {}
+            samples = {}
+            for r, entry in history.items():
+                try:
+                    samples[int(r)] = int((entry or {}).get('time', 0))
+                except (TypeError, ValueError):
+                    continue
+            self._round_starts = {r + 1: t for r, t in samples.items()}
+            if 1 in samples:
+                self._round_starts.setdefault(1, 0)
+        return self._round_starts
+
+
+def _compile_field(scope, field):
+    if scope == "player":
+        def extract(ctx):
+            return _number((ctx.player or {}).get(field)) if ctx.player else None
+    else:
+        def extract(ctx):
+            return _number(ctx.game.get(field))
+    return extract
+
+
+def _compile_term(term):
+    term = term.strip()
+    if term in ALIASES:
+        return _compile_expr(ALIASES[term])
+    if term == "perks_drank":
+        def extract(ctx):
+            if ctx.player is None: return None
+            if 'calculated_perks_drank' in ctx.data:
+                return _number(ctx.data['calculated_perks_drank'])
+            raw_perks = ctx.player.get('perks', [])
+            if isinstance(raw_perks, dict): raw_perks = list(raw_perks.values())
+            return len([x for x in (raw_perks or []) if x and "null" not in x and "pistoldeath" not in x])
+        return extract
+
+    if ":" in term:
+        kind, arg = term.split(":", 1)
+        if kind == "const":
+            value = _number(arg)
+            if value is None: raise ValueError(f"Bad constant in rule: {term}")
+            return lambda ctx: value if ctx.player is not None else None
+        if kind in ("weapon_kills", "weapon_headshots"):
+            name, slot = arg.strip().lower(), 0 if kind == "weapon_kills" else 1
+            return lambda ctx: ctx.weapons().get(name, (0, 0))[slot]
+        if kind == "time_to_round":
+            target = _number(arg)
+            if not isinstance(target, int): raise ValueError(f"Bad round in rule: {term}")
+            return lambda ctx: ctx.round_starts().get(target)
+        raise ValueError(f"Unknown rule kind: {kind}")
+
+    if "." in term:
+        scope, field = term.split(".", 1)
+        if scope in ("player", "game") and field:
+            return _compile_field(scope, field)
+    raise ValueError(f"Unknown stat expression: {term}")
+
+
+def _compile_expr(expr):
+    terms = [_compile_term(t) for t in str(expr).split("|")]
+    if len(terms) == 1:
+        return terms[0]
+
+    def extract(ctx):
+        for term in terms:
+            value = term(ctx)
+            if value is not None:
+                return value
+        return None
+    return extract
+
+
+def compile_rule(expr):
+    """Compile one expression into fn(MatchContext) -> number (missing values read as 0)."""
+    inner = _compile_expr(expr)
+
+    def extract(ctx):
+        value = inner(ctx)
+        return value if value is not None else 0
+    return extract
+
+
+def compile_rules(expressions):
+    """
+    Compile every expression once. Returns (evaluate, errors) where
+    evaluate(game_data) -> { expression: value } and errors maps rejected
+    expressions to their message (they evaluate to 0).
+    """
+    compiled, errors = [], {}
+    for expr in dict.fromkeys(expressions):
+        if expr is None: continue
+        try:
+            compiled.append((expr, compile_rule(expr)))
+        except ValueError as e:
+            errors[expr] = str(e)
+            compiled.append((expr, lambda ctx: 0))
+
+    def evaluate(game_data):
+        ctx = MatchContext(game_data)
+        if ctx.player is None:
+            return {}
+        return {expr: fn(ctx) for expr, fn in compiled}
+    return evaluate, errors
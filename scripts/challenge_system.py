@@ -2,6 +2,10 @@ import os
 import json
 import glob
 import time
+import threading
+
+from match_archive import load_archive_file
+from challenge_rules import compile_rules, BUILTIN_STATS, PER_MATCH_STATS
 
 CHALLENGES_FILE = "challenges.json"
 UNLOCKS_FILE = "unlocked_rewards.json"
@@ -29,6 +33,11 @@ class ChallengeManager:
         self.themes_path = os.path.join(base_path, "themes")
         self.reset_timestamp = 0
         self.reset_offset = {}
+        # game_id -> stats last applied for that game (see apply_game)
+        self.ledger = {}
+        self.needs_rescan = False
+        # Live updates and background rebuilds both mutate progress
+        self.lock = threading.RLock()
         
         self.theme_requirements = {
             "void":            ["c_void_1", "c_void_2", "c_void_3"],
@@ -41,8 +50,34 @@ class ChallengeManager:
         
         self.unlocked_rewards = self._load_unlocks()
         self.challenges = self._load_or_create()
+        self._compile_graph()
         self.check_theme_unlocks()
 
+    def _compile_graph(self):
+        """Index challenges by id, chain, predecessor and consumed stat. Rebuild after the list changes."""
+        self.by_id = {}
+        self.position = {}
+        self.by_stat = {}
+        for i, c in enumerate(self.challenges):
+            self.by_id.setdefault(c['id'], c)
+            self.position.setdefault(c['id'], i)
+            self.by_stat.setdefault(c.get('stat'), []).append(c)
+
+        # Each challenge's "stat" is a rule expression (see challenge_rules.py)
+        expressions = list(BUILTIN_STATS) + [c.get('stat') for c in self.challenges]
+        self.extract_stats, rule_errors = compile_rules(expressions)
+        for expr, msg in rule_errors.items():
+            print(f"Challenge rule error: {msg}")
+        self.cumulative_stats = set(c.get('stat') for c in self.challenges if c.get('type') == 'cumulative')
+
+        self.chain_of = {}
+        self.predecessor = {}
+        for chain_name, chain_list in self.theme_requirements.items():
+            for idx, c_id in enumerate(chain_list):
+                if c_id in self.chain_of: continue
+                self.chain_of[c_id] = chain_name
+                self.predecessor[c_id] = chain_list[idx - 1] if idx > 0 else None
+
     def _load_unlocks(self):
         data = load_json(self.unlocks_path)
         if not data:
@@ -94,6 +129,11 @@ class ChallengeManager:
         
         self.reset_timestamp = saved_data.get("reset_timestamp", 0)
         self.reset_offset = saved_data.get("reset_offset", {})
+        self.ledger = saved_data.get("ledger")
+        if self.ledger is None:
+            # Progress predates the ledger; rebuild both on the next update
+            self.ledger = {}
+            self.needs_rescan = True
         
         current_list = saved_data.get("challenges", [])
         cleaned_list = [c for c in current_list if not c['id'].startswith("c_theme_") and not c.get('cat') in ['daily', 'weekly']]
@@ -112,6 +152,7 @@ class ChallengeManager:
         saved_data["challenges"] = final_list
         saved_data["reset_timestamp"] = self.reset_timestamp
         saved_data["reset_offset"] = self.reset_offset
+        saved_data["ledger"] = self.ledger
         saved_data.pop("last_daily", None)
         saved_data.pop("last_weekly", None)
         save_json(self.filepath, saved_data)
@@ -251,81 +292,18 @@ class ChallengeManager:
         if changed: save_json(self.unlocks_path, self.unlocked_rewards)
 
     def _is_challenge_active(self, c_id):
-        for theme, chain in self.theme_requirements.items():
-            if c_id in chain:
-                idx = chain.index(c_id)
-                if idx == 0: return True 
-                prev_id = chain[idx - 1]
-                prev_c = next((x for x in self.challenges if x['id'] == prev_id), None)
-                return prev_c and prev_c['completed']
-        return True 
+        prev_id = self.predecessor.get(c_id)
+        if prev_id is None: return True
+        prev_c = self.by_id.get(prev_id)
+        return bool(prev_c and prev_c['completed'])
 
     def process_completed_game(self, game_data, save=True):
         if not game_data: return
 
-        game = game_data.get('game') or game_data.get('data', {}).get('game', {})
-        players = game_data.get('players') or game_data.get('data', {}).get('players', {})
-        if not players: return
-        p = list(players.values())[0]
-
-        raw_perks = p.get('perks', [])
-        if isinstance(raw_perks, dict): raw_perks = list(raw_perks.values())
-        valid_perks = [x for x in raw_perks if x and "null" not in x and "pistoldeath" not in x]
-        perks_drank_val = game_data.get('calculated_perks_drank', len(valid_perks))
-
-        stats = {
-            "matches": 1,
-            "kills": int(p.get('kills', 0)),
-            "headshots": int(p.get('headshots', 0)),
-            "doors": int(p.get('doors_purchased', 0)),
-            "round": int(game.get('rounds_total', 0)),
-            "points": int(p.get('player_points_gained', p.get('points', 0))), 
-            "melee": int(p.get('melee_kills', 0)), 
-            "perks_drank": perks_drank_val,
-            "rounds_added": int(game.get('rounds_total', 0))
-        }
-
-        chain_available = {chain: stats.copy() for chain in self.theme_requirements.keys()}
-        changed = False
-
-        for c in self.challenges:
-            if c['completed']: continue
-            if not self._is_challenge_active(c['id']): continue
-
-            my_chain = None
-            for chain_name, chain_list in self.theme_requirements.items():
-                if c['id'] in chain_list:
-                    my_chain = chain_name
-                    break
-                    
-            if my_chain:
-                val = chain_available[my_chain].get(c['stat'], 0)
-            else:
-                val = stats.get(c['stat'], 0)
-
-            if val <= 0: continue
+        stats = self.extract_stats(game_data)
+        if not stats: return
 
-            if c['type'] == 'cumulative':
-                if c['progress'] + val >= c['target']:
-                    excess = (c['progress'] + val) - c['target']
-                    c['progress'] = c['target']
-                    c['completed'] = True
-                    if my_chain:
-                        chain_available[my_chain][c['stat']] = excess 
-                    changed = True
-                else:
-                    c['progress'] += val
-                    if my_chain:
-                        chain_available[my_chain][c['stat']] = 0 
-                    changed = True
-            elif c['type'] == 'single_game':
-                if val >= c['target']:
-                    c['progress'] = c['target']
-                    c['completed'] = True
-                    changed = True
-                elif val > c['progress']:
-                    c['progress'] = val
-                    changed = True
+        changed = self._apply_stats(stats, stats)
         
         self.check_theme_unlocks()
         
@@ -338,12 +316,22 @@ class ChallengeManager:
             save_json(self.filepath, full)
 
     def process_update(self, history_path):
-        if not history_path or not os.path.exists(history_path): return
+        """Full rescan: rebuild cumulative progress and the ledger from every archive."""
+        with self.lock:
+            self._process_update_locked(history_path)
 
+    def _reset_cumulative(self):
         for c in self.challenges:
             if c['type'] == 'cumulative': 
                 c['progress'] = 0
                 c['completed'] = False
+        self.ledger = {}
+        self.needs_rescan = False
+
+    def _process_update_locked(self, history_path):
+        if not history_path or not os.path.exists(history_path): return
+
+        self._reset_cumulative()
 
         json_files = glob.glob(os.path.join(history_path, "Game_*.json"))
         json_files.sort(key=os.path.getmtime) 
@@ -353,68 +341,139 @@ class ChallengeManager:
                 continue
                 
             try:
-                data = load_json(f)
+                data = load_archive_file(f)
                 if not data: continue
                 self._apply_game_stats(data)
             except: pass
             
         self.check_theme_unlocks()
-        full = {"challenges": self.challenges, "reset_timestamp": self.reset_timestamp, "reset_offset": self.reset_offset}
+        self._save()
+
+    def rule_expressions(self):
+        """Every stat expression the current challenges need (for rebuild workers)."""
+        return list(BUILTIN_STATS) + [c.get('stat') for c in self.challenges]
+
+    def rebuild_from_vectors(self, vectors):
+        """
+        Full rebuild from precomputed per-match vectors (see history_rebuild.py),
+        already sorted by archive mtime. Same result as process_update().
+        """
+        with self.lock:
+            self._reset_cumulative()
+            for v in vectors:
+                if v["mtime"] < self.reset_timestamp:
+                    continue
+                stats = self._apply_offset(v["game_id"], dict(v["stats"]))
+                if not stats: continue
+                self._apply_stats(stats, stats)
+                if v["game_id"]:
+                    self.ledger[v["game_id"]] = stats
+            self.check_theme_unlocks()
+            self._save()
+
+    def _save(self):
+        full = {"challenges": self.challenges, "reset_timestamp": self.reset_timestamp,
+                "reset_offset": self.reset_offset, "ledger": self.ledger}
         save_json(self.filepath, full)
 
-    def _apply_game_stats(self, game_data):
+    def apply_game(self, game_data, history_path=None, save=True):
+        with self.lock:
+            return self._apply_game_locked(game_data, history_path, save)
+
+    def _apply_game_locked(self, game_data, history_path=None, save=True):
+        """
+        Incremental update for one game: apply only what changed since the
+        stats last recorded for its game_id in the ledger.
+
+        Cumulative challenges receive the difference, single-game challenges
+        the game's current values.  Falls back to a full rescan (when
+        history_path is given) if the ledger cannot be trusted.
+        """
+        if not game_data: return False
+        if self.needs_rescan:
+            # Legacy progress already counts archived games, this one included;
+            # a delta on an empty ledger would count it twice. Wait for a rescan.
+            if not history_path: return False
+            self._process_update_locked(history_path)
+            return True
+
+        game_id, stats = self._game_stats(game_data)
+        if not game_id: return False
+        previous = self.ledger.get(game_id, {})
+        delta = {k: v - previous.get(k, 0) for k, v in stats.items()}
+        if not any(delta.values()): return False
+
+        if any(delta[k] < 0 for k in self.cumulative_stats if k in delta):
+            # A counter went backwards (perks lost on a down, archive rewritten).
+            # With the history folder at hand, rescan for exact totals; mid-match,
+            # keep the high-water mark and let the finalize pass settle it.
+            if history_path:
+                self._process_update_locked(history_path)
+                return True
+            delta = {k: max(0, v) for k, v in delta.items()}
+            stats = {k: (max(v, previous.get(k, 0)) if k in self.cumulative_stats else v) for k, v in stats.items()}
+        else:
+            # Single-game stats (e.g. zpm) may drop; only cumulative ones feed the delta
+            delta = {k: max(0, v) for k, v in delta.items()}
+
+        completed_before = sum(1 for c in self.challenges if c['completed'])
+        self._apply_stats(delta, stats)
+        self.ledger[game_id] = stats
+        self.check_theme_unlocks()
+
+        completed_now = sum(1 for c in self.challenges if c['completed'])
+        if save or completed_now != completed_before:
+            self._save()
+        return True
+
+    def _game_stats(self, game_data):
+        """(game_id, stats) for the first player, with any mid-match reset offset removed."""
         game = game_data.get('game') or game_data.get('data', {}).get('game', {})
-        players = game_data.get('players') or game_data.get('data', {}).get('players', {})
-        if not players: return
-        p = list(players.values())[0]
+        stats = self.extract_stats(game_data)
+        if not stats: return None, {}
         game_id = str(game.get('game_id', ''))
+        return game_id, self._apply_offset(game_id, stats)
 
-        raw_perks = p.get('perks', [])
-        valid_perks_count = 0
-        if isinstance(raw_perks, dict): raw_perks = list(raw_perks.values())
-        if raw_perks:
-             valid_perks_count = len([x for x in raw_perks if x and "null" not in x and "pistoldeath" not in x])
-        
-        perks_drank_val = game_data.get('calculated_perks_drank', valid_perks_count)
-
-        stats = {
-            "matches": 1,
-            "kills": int(p.get('kills', 0)),
-            "headshots": int(p.get('headshots', 0)),
-            "doors": int(p.get('doors_purchased', 0)),
-            "round": int(game.get('rounds_total', 0)),
-            "points": int(p.get('player_points_gained', p.get('points', 0))), 
-            "melee": int(p.get('melee_kills', 0)),
-            "perks_drank": perks_drank_val,
-            "rounds_added": int(game.get('rounds_total', 0))
-        }
-
+    def _apply_offset(self, game_id, stats):
         # Apply Mid-Match Offset Subtraction
         if self.reset_offset and self.reset_offset.get("game_id") == game_id:
-            stats["matches"] = 0
-            stats["kills"] = max(0, stats["kills"] - self.reset_offset.get("kills", 0))
-            stats["headshots"] = max(0, stats["headshots"] - self.reset_offset.get("headshots", 0))
-            stats["doors"] = max(0, stats["doors"] - self.reset_offset.get("doors", 0))
-            stats["round"] = max(0, stats["round"] - self.reset_offset.get("round", 0))
-            stats["points"] = max(0, stats["points"] - self.reset_offset.get("points", 0))
-            stats["melee"] = max(0, stats["melee"] - self.reset_offset.get("melee", 0))
-            stats["perks_drank"] = max(0, stats["perks_drank"] - self.reset_offset.get("perks_drank", 0))
-            stats["rounds_added"] = max(0, stats["rounds_added"] - self.reset_offset.get("rounds_added", 0))
-
-        chain_available = {chain: stats.copy() for chain in self.theme_requirements.keys()}
+            for k, v in stats.items():
+                if k in PER_MATCH_STATS:
+                    stats[k] = 0
+                elif k in self.reset_offset:
+                    stats[k] = max(0, v - self.reset_offset.get(k, 0))
+        return stats
 
-        for c in self.challenges:
+    def _apply_game_stats(self, game_data):
+        game_id, stats = self._game_stats(game_data)
+        if not stats: return
+        self._apply_stats(stats, stats)
+        if game_id:
+            self.ledger[game_id] = stats
+
+    def _apply_stats(self, stats, single_stats):
+        """
+        Cumulative challenges add from stats; single-game ones compare against
+        single_stats.  Only challenges consuming a non-zero stat are visited,
+        in list order so chain excess still flows to the next step.
+        """
+        live_stats = set(k for k, v in stats.items() if v > 0) | set(k for k, v in single_stats.items() if v > 0)
+        candidates = [c for stat in live_stats for c in self.by_stat.get(stat, ())]
+        candidates.sort(key=lambda c: self.position[c['id']])
+
+        chain_available = {}
+        changed = False
+
+        for c in candidates:
             if not self._is_challenge_active(c['id']): continue
             if c['completed']: continue 
 
-            my_chain = None
-            for chain_name, chain_list in self.theme_requirements.items():
-                if c['id'] in chain_list:
-                    my_chain = chain_name
-                    break
+            my_chain = self.chain_of.get(c['id'])
                     
-            if my_chain:
-                val = chain_available[my_chain].get(c['stat'], 0)
+            if c['type'] in ('single_game', 'single_game_below'):
+                val = single_stats.get(c['stat'], 0)
+            elif my_chain:
+                val = chain_available.setdefault(my_chain, stats.copy()).get(c['stat'], 0)
             else:
                 val = stats.get(c['stat'], 0)
 
@@ -431,15 +490,29 @@ class ChallengeManager:
                     c['progress'] += val
                     if my_chain:
                         chain_available[my_chain][c['stat']] = 0 
+                changed = True
             
             elif c['type'] == 'single_game':
                 if val >= c['target']:
                     c['progress'] = c['target']
                     c['completed'] = True
+                    changed = True
                 elif val > c['progress']:
                     c['progress'] = val
+                    changed = True
+            elif c['type'] == 'single_game_below':
+                # Lower is better (e.g. time_to_round:N); 0 means not reached
+                if val <= c['target']:
+                    c['progress'] = c['target']
+                    c['completed'] = True
+                    changed = True
+        return changed
 
     def reset_all_challenges(self, live_data=None):
+        with self.lock:
+            return self._reset_all_locked(live_data)
+
+    def _reset_all_locked(self, live_data=None):
         for c in self.challenges:
             c['progress'] = 0
             c['completed'] = False
@@ -449,35 +522,19 @@ class ChallengeManager:
         
         self.reset_timestamp = time.time()
         self.reset_offset = {}
+        self.ledger = {}
+        self.needs_rescan = False
         
         # Snapshot current live game stats
         if live_data:
             game = live_data.get('game') or live_data.get('data', {}).get('game', {})
-            players = live_data.get('players') or live_data.get('data', {}).get('players', {})
-            if players:
-                p = list(players.values())[0]
-                game_id = str(game.get('game_id', ''))
-                if game_id:
-                    raw_perks = p.get('perks', [])
-                    valid_perks_count = 0
-                    if isinstance(raw_perks, dict): raw_perks = list(raw_perks.values())
-                    if raw_perks:
-                         valid_perks_count = len([x for x in raw_perks if x and "null" not in x and "pistoldeath" not in x])
-                    
-                    self.reset_offset = {
-                        "game_id": game_id,
-                        "kills": int(p.get('kills', 0)),
-                        "headshots": int(p.get('headshots', 0)),
-                        "doors": int(p.get('doors_purchased', 0)),
-                        "round": int(game.get('rounds_total', 0)),
-                        "points": int(p.get('player_points_gained', p.get('points', 0))), 
-                        "melee": int(p.get('melee_kills', 0)),
-                        "perks_drank": live_data.get('calculated_perks_drank', valid_perks_count),
-                        "rounds_added": int(game.get('rounds_total', 0))
-                    }
+            game_id = str(game.get('game_id', ''))
+            stats = self.extract_stats(live_data)
+            if game_id and stats:
+                self.reset_offset = {"game_id": game_id}
+                self.reset_offset.update({k: v for k, v in stats.items() if k not in PER_MATCH_STATS})
         
-        full = {"challenges": self.challenges, "reset_timestamp": self.reset_timestamp, "reset_offset": self.reset_offset}
-        save_json(self.filepath, full)
+        self._save()
         return True
 
     def scan_all_history(self, history_path):
@@ -0,0 +1,203 @@
+"""
+history_rebuild.py - Parallel cold rebuild of everything derived from history.
+
+Archives are parsed in a process pool.  Each worker reduces a match to a
+compact vector (challenge rule values, career contribution, file mtime and
+size) and refreshes the archive's summary header; the parent sorts the
+vectors by mtime and merges them into the challenge ledger, the lifetime
+aggregates and the match index.  Progress can be polled and the rebuild can
+be cancelled between chunks.
+"""
+
+import os
+import sys
+import glob
+import time
+import threading
+import multiprocessing
+from importlib.machinery import ModuleSpec
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from match_archive import ARCHIVE_PREFIX, ARCHIVE_EXT, load_archive_file, refresh_summary, game_id_from_filename
+from challenge_rules import compile_rules, BUILTIN_STATS
+from lifetime_stats import match_contribution
+
+CHUNK_SIZE = 64
+# Below this many archives, process start-up costs more than it saves
+PARALLEL_MIN_FILES = 256
+
+_worker_evaluate = None
+
+
+def process_pool(workers, initializer=None, initargs=()):
+    """
+    ProcessPoolExecutor whose workers do not re-import the app's __main__.
+
+    With spawn (Windows), every worker would otherwise run bo3tracker.py as
+    __mp_main__: pywebview, the whole UI module and its listener setup.
+    Workers only need this module.  spawn skips that fix-up for a main
+    module named "__main__", so the name is swapped in while the workers
+    start; they all start on the first submit.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+    main = sys.modules.get("__main__")
+    if multiprocessing.get_start_method() == "fork" or main is None:
+        return pool
+    saved_spec = getattr(main, "__spec__", None)
+    main.__spec__ = ModuleSpec("__main__", None)
+    try:
+        pool.submit(int)
+    finally:
+        main.__spec__ = saved_spec
+    return pool
+
+
+def _init_worker(expressions):
+    global _worker_evaluate
+    _worker_evaluate, _ = compile_rules(expressions)
+
+
+def _extract_vector(path):
+    try:
+        st = os.stat(path)
+        data = load_archive_file(path)
+    except OSError:
+        return None
+    if not data:
+        return None
+    refresh_summary(path, data)
+    game = data.get('game') or data.get('data', {}).get('game', {}) or {}
+    return {
+        "path": path,
+        "file_id": game_id_from_filename(path),
+        "game_id": str(game.get('game_id', '')),
+        "mtime": st.st_mtime,
+        "size": st.st_size,
+        "stats": _worker_evaluate(data) if _worker_evaluate else {},
+        "contrib": match_contribution(data),
+    }
+
+
+def extract_chunk(paths, expressions=None):
+    """Worker entry point: one vector per readable archive in paths."""
+    if expressions is not None and _worker_evaluate is None:
+        _init_worker(expressions)
+    return [v for v in (_extract_vector(p) for p in paths) if v]
+
+
+def extract_all(files, expressions, workers=None, progress=None, cancel=None):
+    """Vectors for every archive in files, in no particular order. None if cancelled."""
+    vectors = []
+    chunks = [files[i:i + CHUNK_SIZE] for i in range(0, len(files), CHUNK_SIZE)]
+    done = 0
+    workers = workers or os.cpu_count() or 1
+    if len(files) < PARALLEL_MIN_FILES or workers <= 1:
+        _init_worker(expressions)
+        for chunk in chunks:
+            if cancel and cancel(): return None
+            vectors.extend(extract_chunk(chunk))
+            done += len(chunk)
+            if progress: progress(done, len(files))
+        return vectors
+
+    with process_pool(workers, _init_worker, (expressions,)) as pool:
+        futures = {pool.submit(extract_chunk, chunk): len(chunk) for chunk in chunks}
+        for future in as_completed(futures):
+            if cancel and cancel():
+                for f in futures: f.cancel()
+                return None
+            try:
+                vectors.extend(future.result())
+            except Exception as e:
+                print(f"History rebuild worker error: {e}")
+            done += futures[future]
+            if progress: progress(done, len(files))
+    return vectors
+
+
+class HistoryRebuild:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.status = {"running": False, "phase": "idle", "done": 0, "total": 0,
+                       "cancelled": False, "seconds": 0.0, "msg": ""}
+
+    def get_status(self):
+        with self.lock:
+            return dict(self.status)
+
+    def _update(self, **fields):
+        with self.lock:
+            self.status.update(fields)
+
+    def cancel(self):
+        self.cancel_event.set()
+        return True
+
+    def start(self, history_path, challenge_manager, lifetime_stats=None, match_index=None, workers=None):
+        """Start a background rebuild. Returns False if one is already running."""
+        with self.lock:
+            if self.status["running"]:
+                return False
+            self.status = {"running": True, "phase": "scanning", "done": 0, "total": 0,
+                           "cancelled": False, "seconds": 0.0, "msg": ""}
+        self.cancel_event.clear()
+        self.thread = threading.Thread(
+            target=self._run, args=(history_path, challenge_manager, lifetime_stats, match_index, workers), daemon=True
+        )
+        self.thread.start()
+        return True
+
+    def run(self, history_path, challenge_manager, lifetime_stats=None, match_index=None, workers=None):
+        """Blocking rebuild (used by the background thread and the command line)."""
+        started = time.perf_counter()
+        files = glob.glob(os.path.join(history_path, f"{ARCHIVE_PREFIX}*{ARCHIVE_EXT}"))
+        self._update(phase="parsing", total=len(files), done=0)
+        vectors = extract_all(
+            files, challenge_manager.rule_expressions(), workers,
+            progress=lambda done, total: self._update(done=done),
+            cancel=self.cancel_event.is_set
+        )
+
+        if vectors is None:
+            self._update(cancelled=True, seconds=time.perf_counter() - started, msg="Rebuild cancelled; nothing was changed.")
+            return None
+
+        self._update(phase="merging")
+        vectors.sort(key=lambda v: v["mtime"])
+        challenge_manager.rebuild_from_vectors(vectors)
+        if lifetime_stats is not None:
+            lifetime_stats.replace_all(history_path, [(v["file_id"], v["contrib"], v["mtime"], v["size"]) for v in vectors])
+        if match_index is not None:
+            # Summary headers are fresh now, so this only reads sidecars
+            match_index.sync_folder(history_path)
+
+        elapsed = time.perf_counter() - started
+        self._update(seconds=elapsed, msg=f"Rebuilt from {len(vectors)} match(es) in {elapsed:.1f}s.")
+        return len(vectors)
+
+    def _run(self, *args):
+        try:
+            self.run(*args)
+        except Exception as e:
+            self._update(msg=f"Rebuild failed: {e}")
+        finally:
+            self._update(running=False, phase="idle")
+
+
+# Singleton instance to be imported by bo3tracker.py
+history_rebuild_instance = HistoryRebuild()
+
+
+if __name__ == "__main__":
+    # Parse-phase benchmark: python history_rebuild.py <history_folder> [workers]
+    if len(sys.argv) < 2:
+        print("Usage: python history_rebuild.py <history_folder> [workers]")
+        sys.exit(1)
+    archive_files = glob.glob(os.path.join(sys.argv[1], f"{ARCHIVE_PREFIX}*{ARCHIVE_EXT}"))
+    worker_count = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    t0 = time.perf_counter()
+    result = extract_all(archive_files, list(BUILTIN_STATS), worker_count)
+    elapsed = time.perf_counter() - t0
+    print(f"Parsed {len(result)} archive(s) in {elapsed:.2f}s ({len(result) / max(elapsed, 1e-9):.0f}/s)")
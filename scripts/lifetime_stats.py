@@ -0,0 +1,242 @@
+"""
+lifetime_stats.py - Persisted career aggregates for the Career tab.
+
+Keeps running totals plus per-map and per-weapon counters for every archived
+match, and a per-game ledger of what each match contributed.  A finalized
+match is folded in once; a deleted or rewritten archive is subtracted using
+its ledger entry, so the Career tab no longer re-parses the whole history
+folder every time it opens.  rebuild() recomputes everything from scratch.
+"""
+
+import os
+import json
+import threading
+
+from match_archive import (ARCHIVE_PREFIX, ARCHIVE_EXT, load_archive_file, write_json_atomic,
+                           game_id_from_filename as _game_id_of, folder_key as _folder_key, get_base_path)
+
+STATS_FILE = "lifetime_stats.json"
+STATS_VERSION = 1
+
+TOTAL_KEYS = ("kills", "headshots", "downs", "rounds", "time_sec", "matches", "doors", "gums", "box", "pts")
+
+
+def match_contribution(data):
+    """What one archive adds to the career totals, or None if it has no usable player."""
+    if not data: return None
+    try:
+        game = data.get('game') or data.get('data', {}).get('game', {})
+        players = data.get('players') or data.get('data', {}).get('players', {})
+        if not players: return None
+
+        # Career Stats are locked to Player '0' (The Host/Local Player)
+        p = list(players.values())[0]
+
+        weapons = {}
+        w_data = p.get('weapon_data', p.get('top5', {}))
+        for k, w in w_data.items():
+            name = w.get('display', 'Unknown')
+            if name == "none" or name == "Unknown": continue
+            weapons[name] = weapons.get(name, 0) + int(w.get('kills', 0))
+
+        return {
+            "totals": {
+                "matches": 1,
+                "kills": int(p.get('kills', 0)),
+                "headshots": int(p.get('headshots', 0)),
+                "downs": int(p.get('downs', 0)),
+                "rounds": int(game.get('rounds_total', 0)),
+                "time_sec": int(game.get('time_total', 0)),
+                "doors": int(p.get('doors_purchased', 0)),
+                "gums": int(p.get('gobblegums_used', 0)),
+                "box": int(p.get('true_match_box', 0)),
+                "pts": int(p.get('true_match_points', 0)),
+            },
+            "map": str(game.get('map_played', 'Unknown')).replace('_', ' ').title(),
+            "weapons": weapons,
+        }
+    except Exception:
+        return None
+
+
+def _empty_state(folder_key=None):
+    return {
+        "version": STATS_VERSION,
+        "folder": folder_key,
+        "totals": {k: 0 for k in TOTAL_KEYS},
+        # map -> { "count", "time", "rounds": { round: matches that ended on it } }
+        "maps": {},
+        "weapons": {},
+        # game_id -> { "mtime", "size", "contrib" }
+        "ledger": {},
+    }
+
+
+class LifetimeStats:
+    def __init__(self, stats_file=None):
+        self.stats_file = stats_file or os.path.join(get_base_path(), STATS_FILE)
+        self.lock = threading.RLock()
+        self.state = None
+        self.synced_folders = set()
+
+    # --- PERSISTENCE ---
+    def _load_locked(self):
+        if self.state is not None:
+            return
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("version") != STATS_VERSION:
+                state = _empty_state()
+        except Exception:
+            state = _empty_state()
+        self.state = state
+
+    def save(self):
+        with self.lock:
+            if self.state is not None:
+                write_json_atomic(self.stats_file, self.state, indent=None)
+
+    def _bind_folder_locked(self, folder):
+        self._load_locked()
+        key = _folder_key(folder)
+        if self.state.get("folder") != key:
+            # Aggregates belong to one history folder; start over for a new one
+            self.state = _empty_state(key)
+            self.synced_folders.discard(key)
+
+    # --- ARITHMETIC ---
+    def _fold_locked(self, contrib, sign):
+        if not contrib: return
+        totals = self.state["totals"]
+        for k, v in contrib["totals"].items():
+            totals[k] = totals.get(k, 0) + sign * v
+
+        m = self.state["maps"].setdefault(contrib["map"], {"count": 0, "time": 0, "rounds": {}})
+        m["count"] += sign
+        m["time"] += sign * contrib["totals"]["time_sec"]
+        rnd = str(contrib["totals"]["rounds"])
+        m["rounds"][rnd] = m["rounds"].get(rnd, 0) + sign
+        if m["rounds"][rnd] <= 0: del m["rounds"][rnd]
+        if m["count"] <= 0: del self.state["maps"][contrib["map"]]
+
+        weapons = self.state["weapons"]
+        for name, kills in contrib["weapons"].items():
+            weapons[name] = weapons.get(name, 0) + sign * kills
+
+    def _remove_locked(self, game_id):
+        entry = self.state["ledger"].pop(str(game_id), None)
+        if entry:
+            self._fold_locked(entry.get("contrib"), -1)
+        return entry is not None
+
+    def _apply_locked(self, game_id, contrib, mtime, size):
+        self._remove_locked(game_id)
+        self.state["ledger"][str(game_id)] = {"mtime": mtime, "size": size, "contrib": contrib}
+        self._fold_locked(contrib, 1)
+
+    # --- UPDATES ---
+    def record_archive(self, folder, archive_file, save=True):
+        """Fold one archive in, replacing whatever it contributed before."""
+        try:
+            st = os.stat(archive_file)
+        except OSError:
+            return False
+        game_id = _game_id_of(archive_file)
+        with self.lock:
+            self._bind_folder_locked(folder)
+            entry = self.state["ledger"].get(game_id)
+            if entry and entry.get("mtime") == st.st_mtime and entry.get("size") == st.st_size:
+                return False
+        contrib = match_contribution(load_archive_file(archive_file))
+        with self.lock:
+            self._apply_locked(game_id, contrib, st.st_mtime, st.st_size)
+        if save: self.save()
+        return True
+
+    def remove_archive(self, folder, game_id, save=True):
+        with self.lock:
+            self._bind_folder_locked(folder)
+            removed = self._remove_locked(game_id)
+        if removed and save: self.save()
+        return removed
+
+    def sync_folder(self, folder):
+        """Fold in new/changed archives and subtract deleted ones, by mtime and size."""
+        key = _folder_key(folder)
+        on_disk = {}
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.name.startswith(ARCHIVE_PREFIX) and entry.name.endswith(ARCHIVE_EXT) and entry.is_file():
+                        on_disk[_game_id_of(entry.name)] = entry.path
+        except OSError:
+            return 0
+
+        changed = 0
+        with self.lock:
+            self._bind_folder_locked(folder)
+            for game_id in [g for g in self.state["ledger"] if g not in on_disk]:
+                self._remove_locked(game_id)
+                changed += 1
+        for path in on_disk.values():
+            if self.record_archive(folder, path, save=False):
+                changed += 1
+        if changed: self.save()
+        self.synced_folders.add(key)
+        return changed
+
+    def ensure_synced(self, folder):
+        if _folder_key(folder) not in self.synced_folders:
+            self.sync_folder(folder)
+
+    def replace_all(self, folder, entries):
+        """Replace every aggregate with precomputed (game_id, contrib, mtime, size) entries."""
+        key = _folder_key(folder)
+        with self.lock:
+            self.state = _empty_state(key)
+            for game_id, contrib, mtime, size in entries:
+                self._apply_locked(game_id, contrib, mtime, size)
+        self.save()
+        self.synced_folders.add(key)
+
+    def rebuild(self, folder):
+        with self.lock:
+            self.state = _empty_state(_folder_key(folder))
+        self.synced_folders.discard(_folder_key(folder))
+        return self.sync_folder(folder)
+
+    # --- READS ---
+    def get_view(self, folder, overlay_id=None, overlay_data=None):
+        """
+        Return (totals, weapon_stats, map_high_rounds, map_play_counts, map_play_times).
+
+        overlay_data, if given, replaces the ledger entry for overlay_id in the
+        result only (used for the match that is still in progress).
+        """
+        with self.lock:
+            self._bind_folder_locked(folder)
+            swap = overlay_id is not None and overlay_data is not None
+            if swap:
+                old_entry = self.state["ledger"].get(str(overlay_id))
+                old_contrib = old_entry.get("contrib") if old_entry else None
+                new_contrib = match_contribution(overlay_data)
+                self._fold_locked(old_contrib, -1)
+                self._fold_locked(new_contrib, 1)
+            try:
+                totals = dict(self.state["totals"])
+                weapon_stats = dict(self.state["weapons"])
+                map_high_rounds, map_play_counts, map_play_times = {}, {}, {}
+                for name, m in self.state["maps"].items():
+                    map_play_counts[name] = m["count"]
+                    map_play_times[name] = m["time"]
+                    map_high_rounds[name] = max((int(r) for r in m["rounds"]), default=0)
+            finally:
+                if swap:
+                    self._fold_locked(new_contrib, -1)
+                    self._fold_locked(old_contrib, 1)
+        return totals, weapon_stats, map_high_rounds, map_play_counts, map_play_times
+
+
+# Singleton instance to be imported by bo3tracker.py
+lifetime_stats_instance = LifetimeStats()
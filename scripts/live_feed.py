@@ -0,0 +1,279 @@
+"""
+live_feed.py - Change-driven watcher for the UEM CurrentGame.json file.
+
+Instead of re-reading and parsing the live file on a fixed timer, the
+watcher fingerprints it with a single stat() call (mtime_ns, size, inode)
+and only parses when that fingerprint changes.  On Linux it blocks on
+inotify so an idle game costs nothing until the file is written; on every
+other platform it falls back to cheap stat polling.
+"""
+
+import os
+import sys
+import json
+import time
+import select
+import threading
+
+POLL_INTERVAL = 0.25
+INOTIFY_TIMEOUT = 1.0
+
+# inotify(7) event masks used when watching the live file's directory.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+def get_fingerprint(path):
+    """Return a cheap (mtime_ns, size, inode) fingerprint, or None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _parse_file(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+class _InotifyWaiter:
+    """Blocks until something in the watched directory changes (Linux only)."""
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # Drain the queue; we only care that *something* happened.
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        return True
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class LiveFileWatcher:
+    """
+    Watches a single JSON file and publishes a new snapshot each time its
+    contents change.
+
+    Consumers either register a callback with subscribe() or block in
+    wait_for_snapshot() with the last version they have seen.
+    """
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.path = None
+        self.fingerprint = None
+        self.version = 0
+        self.snapshot = None
+        self.subscribers = []
+        self.condition = threading.Condition()
+        self._thread = None
+        # Owned by the watcher thread; other threads only flag it stale
+        self._waiter = None
+        self._waiter_dir = None
+        self._waiter_stale = False
+
+    def set_path(self, path):
+        """Point the watcher at a (possibly new) file. Cheap if unchanged."""
+        with self.condition:
+            if path == self.path:
+                return
+            self.path = path
+            self.fingerprint = None
+            # The watcher thread may be blocked on the waiter's fd; let it close and re-create it
+            self._waiter_stale = True
+
+    def subscribe(self, callback):
+        """Call callback(version, data) for every new snapshot."""
+        with self.condition:
+            self.subscribers.append(callback)
+
+    def start(self):
+        with self.condition:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def get_latest(self):
+        with self.condition:
+            return self.version, self.snapshot
+
+    def wait_for_snapshot(self, last_version, timeout=None):
+        """
+        Block until a snapshot newer than last_version is published.
+
+        Returns (version, data); version equals last_version on timeout.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != last_version, timeout)
+            return self.version, self.snapshot
+
+    def check_now(self):
+        """Stat the file once and publish a snapshot if it changed."""
+        path = self.path
+        if not path:
+            return False
+        fingerprint = get_fingerprint(path)
+        if fingerprint is None or fingerprint == self.fingerprint:
+            return False
+
+        data = _parse_file(path)
+        if data is None:
+            # Most likely caught the game mid-write; retry on the next event.
+            return False
+
+        with self.condition:
+            if path != self.path:
+                return False
+            self.fingerprint = fingerprint
+            self.version += 1
+            self.snapshot = data
+            version = self.version
+            subscribers = list(self.subscribers)
+            self.condition.notify_all()
+
+        for callback in subscribers:
+            try:
+                callback(version, data)
+            except Exception as e:
+                print(f"Live feed subscriber error: {e}")
+        return True
+
+    def _get_waiter(self):
+        """Called on the watcher thread only."""
+        with self.condition:
+            path = self.path
+            stale, self._waiter_stale = self._waiter_stale, False
+        if stale:
+            self._close_waiter()
+        if not sys.platform.startswith("linux") or not path:
+            return None
+        directory = os.path.dirname(os.path.abspath(path))
+        if self._waiter and self._waiter_dir == directory:
+            return self._waiter
+        self._close_waiter()
+        try:
+            self._waiter = _InotifyWaiter(directory)
+            self._waiter_dir = directory
+        except Exception:
+            self._waiter = None
+            self._waiter_dir = None
+        return self._waiter
+
+    def _close_waiter(self):
+        if self._waiter:
+            self._waiter.close()
+        self._waiter = None
+        self._waiter_dir = None
+
+    def _run(self):
+        while True:
+            try:
+                # Arm the waiter before checking so no write slips between the two
+                waiter = self._get_waiter()
+                self.check_now()
+                if waiter:
+                    waiter.wait(INOTIFY_TIMEOUT)
+                else:
+                    time.sleep(self.poll_interval)
+            except Exception as e:
+                print(f"Live feed watcher error: {e}")
+                self._close_waiter()
+                time.sleep(self.poll_interval)
+
+
+class LiveSnapshotBus:
+    """
+    Single shared source of live snapshots for every consumer in the app.
+
+    The watcher parses each new version of the file exactly once.  Derived
+    results (e.g. the processed dashboard stats) are cached per version, so
+    monitor_game, get_live_stats and the overlay all share one parse and one
+    render instead of each hitting the disk on their own timer.
+
+    Snapshots are shared between threads and must be treated as read-only;
+    take a deep copy before enriching one.
+    """
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+        self.lock = threading.Lock()
+        self.derived = {}
+        self.derived_locks = {}
+
+    def attach(self, path):
+        """Follow the given live file, starting the watcher if needed."""
+        self.watcher.set_path(path)
+        self.watcher.start()
+
+    def get_latest(self):
+        version, data = self.watcher.get_latest()
+        if version == 0 and self.watcher.path:
+            # First reader before the watcher thread got a chance to run
+            self.watcher.check_now()
+            version, data = self.watcher.get_latest()
+        return version, data
+
+    def wait_for_snapshot(self, last_version, timeout=None):
+        return self.watcher.wait_for_snapshot(last_version, timeout)
+
+    def get_derived(self, key, builder):
+        """
+        Return builder(snapshot) for the latest snapshot, computing it at most
+        once per version no matter how many consumers ask for it.
+        """
+        version, data = self.get_latest()
+        if data is None:
+            return None
+
+        with self.lock:
+            cached = self.derived.get(key)
+            if cached and cached[0] == version:
+                return cached[1]
+            key_lock = self.derived_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                cached = self.derived.get(key)
+                if cached and cached[0] == version:
+                    return cached[1]
+            value = builder(data)
+            with self.lock:
+                self.derived[key] = (version, value)
+            return value
+
+
+# Singleton instances to be imported by bo3tracker.py
+live_watcher_instance = LiveFileWatcher()
+live_bus_instance = LiveSnapshotBus(live_watcher_instance)
@@ -0,0 +1,516 @@
+"""
+match_archive.py - Journaled storage for the per-match Game_<id>.json archives.
+
+The canonical archive is still a plain Game_<id>.json file.  While a match is
+in progress, each change is appended to Game_<id>.journal as a compact delta
+record (only the paths that changed) instead of rewriting the whole archive,
+which keeps growing as round_history does.  The journal is folded back into
+the canonical JSON when the match ends, after a fixed number of records, or
+on demand.  Readers go through load_archive_file(), which replays any pending
+journal transparently.
+
+Archives can optionally be stored compact: minified JSON, gzip-compressed,
+under the same Game_<id>.json name.  Readers tell the two formats apart by
+the gzip magic bytes, so either can sit in the same folder.
+
+Next to each archive the writer keeps a small Game_<id>.summary header with
+the game block and each player's scalar fields.  load_archive_summary()
+serves list views from it without materializing weapon_data, top5 or
+round_history, and rebuilds it from the archive when missing or stale.
+"""
+
+import os
+import sys
+import gzip
+import json
+import glob
+import time
+import tempfile
+import threading
+
+ARCHIVE_PREFIX = "Game_"
+ARCHIVE_EXT = ".json"
+JOURNAL_EXT = ".journal"
+SUMMARY_EXT = ".summary"
+COMPACT_EVERY_RECORDS = 200
+
+GZIP_MAGIC = b"\x1f\x8b"
+GZIP_LEVEL = 6
+
+_MISSING = object()
+_compact_mode = False
+
+
+# Helper to get the correct path whether running as a .py script or compiled .exe.
+# App state written by the helper modules lives in this folder.
+def get_base_path():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def set_compact_mode(enabled):
+    """Choose the format used for archives written from now on."""
+    global _compact_mode
+    _compact_mode = bool(enabled)
+
+
+def is_compact_mode():
+    return _compact_mode
+
+
+def archive_path(history_path, game_id):
+    return os.path.join(history_path, f"{ARCHIVE_PREFIX}{game_id}{ARCHIVE_EXT}")
+
+
+def game_id_from_filename(filename):
+    """Game_<id>.json (or a path to one) -> <id>."""
+    name = os.path.basename(filename)
+    if name.startswith(ARCHIVE_PREFIX):
+        name = name[len(ARCHIVE_PREFIX):]
+    if name.endswith(ARCHIVE_EXT):
+        name = name[:-len(ARCHIVE_EXT)]
+    return name
+
+
+def folder_key(folder):
+    """Normalized history folder path, the key every derived store uses for a folder."""
+    return os.path.normcase(os.path.abspath(folder))
+
+
+def journal_path_for(archive_file):
+    return os.path.splitext(archive_file)[0] + JOURNAL_EXT
+
+
+def summary_path_for(archive_file):
+    return os.path.splitext(archive_file)[0] + SUMMARY_EXT
+
+
+def list_journals(history_path):
+    return glob.glob(os.path.join(history_path, f"{ARCHIVE_PREFIX}*{JOURNAL_EXT}"))
+
+
+def decode_archive(raw):
+    if raw[:2] == GZIP_MAGIC:
+        raw = gzip.decompress(raw)
+    return json.loads(raw.decode('utf-8'))
+
+
+def encode_archive(data, compact=None):
+    compact = _compact_mode if compact is None else compact
+    if compact:
+        return gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), GZIP_LEVEL)
+    return json.dumps(data, indent=4).encode('utf-8')
+
+
+def is_compact_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(2) == GZIP_MAGIC
+    except OSError:
+        return False
+
+
+def read_json_file(path):
+    """Parse a plain or gzip-compressed JSON file, or return None."""
+    try:
+        with open(path, 'rb') as f:
+            return decode_archive(f.read())
+    except Exception:
+        return None
+
+
+_read_json = read_json_file
+
+
+def _write_bytes_atomic(path, payload):
+    # A unique temp file per write, so concurrent writers of one path never share one
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        # mkstemp creates the file private; keep the target's permissions instead
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except OSError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+        return True
+    except Exception:
+        if tmp_path:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return False
+
+
+def write_json_atomic(path, data, indent=4):
+    """Write JSON to a temp file and rename it over the target."""
+    try:
+        payload = json.dumps(data, indent=indent).encode('utf-8')
+    except Exception:
+        return False
+    return _write_bytes_atomic(path, payload)
+
+
+def write_archive_atomic(path, data, compact=None):
+    """Write a match archive in the current (or the given) storage format."""
+    try:
+        payload = encode_archive(data, compact)
+    except Exception:
+        return False
+    return _write_bytes_atomic(path, payload)
+
+
+# --- DELTAS ---
+def compute_delta(old, new, path=None):
+    """
+    Return (sets, deletes) describing how to turn old into new.
+
+    Dicts are compared key by key; any other value (including lists) is
+    treated as a leaf and replaced whole when it differs.
+    """
+    path = path or []
+    sets, deletes = [], []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, new_val in new.items():
+            old_val = old.get(key, _MISSING)
+            if old_val is _MISSING:
+                sets.append([path + [key], new_val])
+            elif old_val is not new_val and old_val != new_val:
+                sub_sets, sub_deletes = compute_delta(old_val, new_val, path + [key])
+                sets.extend(sub_sets)
+                deletes.extend(sub_deletes)
+        for key in old:
+            if key not in new:
+                deletes.append(path + [key])
+    elif old != new:
+        sets.append([path, new])
+    return sets, deletes
+
+
+def apply_delta(doc, record):
+    """Apply one journal record to doc in place and return the (possibly new) doc."""
+    for path, value in record.get("set", []):
+        if not path:
+            doc = value
+            continue
+        node = doc
+        for key in path[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                child = {}
+                node[key] = child
+            node = child
+        node[path[-1]] = value
+    for path in record.get("del", []):
+        node = doc
+        for key in path[:-1]:
+            node = node.get(key) if isinstance(node, dict) else None
+            if node is None:
+                break
+        if isinstance(node, dict):
+            node.pop(path[-1], None)
+    return doc
+
+
+def _replay_journal(doc, journal_file):
+    try:
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append; ignore the rest
+                    break
+                doc = apply_delta(doc if doc is not None else {}, record)
+    except OSError:
+        pass
+    return doc
+
+
+# --- READERS ---
+def load_archive_file(path):
+    """Load an archive, replaying its pending journal if one exists."""
+    doc = _read_json(path)
+    journal_file = journal_path_for(path)
+    if os.path.exists(journal_file):
+        doc = _replay_journal(doc, journal_file)
+    return doc
+
+
+def load_archive(history_path, game_id):
+    return load_archive_file(archive_path(history_path, game_id))
+
+
+# --- SUMMARY HEADERS ---
+def _scalars(block):
+    return {k: v for k, v in (block or {}).items() if not isinstance(v, (dict, list))}
+
+
+def extract_summary(data):
+    """The game block plus each player's scalar fields, in the archive's own shape."""
+    if not data: return None
+    game = data.get('game') or data.get('data', {}).get('game', {}) or {}
+    players = data.get('players') or data.get('data', {}).get('players', {}) or {}
+    return {
+        "game": _scalars(game),
+        "players": {str(pid): _scalars(p) for pid, p in players.items()},
+    }
+
+
+def sets_touch_summary(sets, deletes):
+    """Whether a delta can change anything extract_summary() keeps."""
+    for path in [s[0] for s in sets] + list(deletes):
+        if path and path[0] == 'data':
+            path = path[1:]
+        if len(path) < 2:
+            return True
+        if path[0] == 'game' and len(path) == 2:
+            return True
+        if path[0] == 'players' and len(path) <= 3:
+            return True
+    return False
+
+
+def write_summary(archive_file, data):
+    summary = extract_summary(data)
+    if summary is None: return False
+    return write_json_atomic(summary_path_for(archive_file), summary, indent=None)
+
+
+def _summary_is_fresh(archive_file, summary_file):
+    try:
+        summary_mtime = os.stat(summary_file).st_mtime_ns
+        if summary_mtime < os.stat(archive_file).st_mtime_ns:
+            return False
+        journal_file = journal_path_for(archive_file)
+        return not os.path.exists(journal_file) or summary_mtime >= os.stat(journal_file).st_mtime_ns
+    except OSError:
+        return False
+
+
+def refresh_summary(path, data):
+    """Rewrite the summary header for path only if it is missing or stale."""
+    if _summary_is_fresh(path, summary_path_for(path)):
+        return False
+    return write_summary(path, data)
+
+
+def load_archive_summary(path):
+    """Header-only view of an archive; falls back to (and re-caches) a full read."""
+    summary_file = summary_path_for(path)
+    if _summary_is_fresh(path, summary_file):
+        summary = _read_json(summary_file)
+        if summary is not None:
+            return summary
+    data = load_archive_file(path)
+    if data is None:
+        return None
+    write_summary(path, data)
+    return extract_summary(data)
+
+
+# --- WRITER ---
+class MatchJournal:
+    """
+    Append-only writer for in-progress matches.
+
+    record() takes ownership of the document it is given and keeps it as the
+    baseline for the next delta, so callers must pass a fresh object per tick.
+    """
+
+    def __init__(self, compact_every=COMPACT_EVERY_RECORDS):
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        # { archive_file: { "doc": last written document, "records": journal length } }
+        self.open_matches = {}
+
+    def record(self, history_path, game_id, data):
+        """Persist data for game_id. True if written, None if nothing changed, False if the write failed."""
+        target = archive_path(history_path, game_id)
+        with self.lock:
+            state = self.open_matches.get(target)
+            if state is None:
+                baseline = load_archive_file(target) if os.path.exists(target) else None
+                if baseline is None:
+                    if not write_archive_atomic(target, data):
+                        return False
+                    write_summary(target, data)
+                    self.open_matches[target] = {"doc": data, "records": 0}
+                    return True
+                state = {"doc": baseline, "records": self._count_records(target)}
+                self.open_matches[target] = state
+
+            sets, deletes = compute_delta(state["doc"], data)
+            if not sets and not deletes:
+                return None
+
+            record = {"t": int(time.time())}
+            if sets: record["set"] = sets
+            if deletes: record["del"] = deletes
+            try:
+                with open(journal_path_for(target), 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, separators=(',', ':')) + "\n")
+                # Keep the archive's mtime meaningful for history ordering
+                os.utime(target, None)
+            except OSError:
+                return False
+            if sets_touch_summary(sets, deletes):
+                write_summary(target, data)
+            else:
+                # Header content is unchanged; just mark it fresh again
+                try:
+                    os.utime(summary_path_for(target), None)
+                except OSError:
+                    write_summary(target, data)
+
+            state["doc"] = data
+            state["records"] += 1
+            if state["records"] >= self.compact_every:
+                self._compact_locked(target, state["doc"])
+                state["records"] = 0
+            return True
+
+    def compact(self, history_path, game_id, close=True):
+        """Fold the journal for game_id into its canonical JSON."""
+        return self.compact_file(archive_path(history_path, game_id), close)
+
+    def compact_file(self, target, close=True):
+        with self.lock:
+            state = self.open_matches.get(target)
+            doc = state["doc"] if state else load_archive_file(target)
+            ok = self._compact_locked(target, doc)
+            if state:
+                state["records"] = 0
+            if close:
+                self.open_matches.pop(target, None)
+            return ok
+
+    def compact_all(self, history_path, keep_open=None):
+        """Compact every leftover journal in the folder (e.g. after a crash)."""
+        compacted = 0
+        keep = archive_path(history_path, keep_open) if keep_open else None
+        for journal_file in list_journals(history_path):
+            target = os.path.splitext(journal_file)[0] + ARCHIVE_EXT
+            if target == keep:
+                continue
+            if self.compact_file(target):
+                compacted += 1
+        return compacted
+
+    def _compact_locked(self, target, doc):
+        journal_file = journal_path_for(target)
+        if not os.path.exists(journal_file):
+            return True
+        if doc is None:
+            return False
+        if not write_archive_atomic(target, doc):
+            return False
+        write_summary(target, doc)
+        try:
+            os.remove(journal_file)
+        except OSError:
+            pass
+        return True
+
+    def _count_records(self, target):
+        try:
+            with open(journal_path_for(target), 'r', encoding='utf-8') as f:
+                return sum(1 for line in f if line.strip())
+        except OSError:
+            return 0
+
+
+# Singleton instance to be imported by bo3tracker.py
+match_journal_instance = MatchJournal()
+
+
+# --- MIGRATION ---
+def migrate_folder(history_path, compact=True, journal=None, progress=None, cancel=None):
+    """
+    Rewrite every archive in history_path in the requested format, in place.
+
+    Each converted file is decoded again and compared with the original
+    before it replaces it, and keeps its original mtime so history ordering
+    is unchanged.  Archives with a pending journal (or open in journal) are
+    skipped.  Returns a report with the size and read-time totals.
+    """
+    files = glob.glob(os.path.join(history_path, f"{ARCHIVE_PREFIX}*{ARCHIVE_EXT}"))
+    report = {
+        "files": len(files), "converted": 0, "skipped": 0, "failed": 0,
+        "bytes_before": 0, "bytes_after": 0, "read_seconds_before": 0.0, "read_seconds_after": 0.0,
+    }
+    for i, target in enumerate(files):
+        if cancel and cancel():
+            report["cancelled"] = True
+            break
+        if progress:
+            progress(i, len(files))
+        lock = journal.lock if journal else threading.Lock()
+        with lock:
+            if (journal and target in journal.open_matches) or os.path.exists(journal_path_for(target)):
+                report["skipped"] += 1
+                continue
+            try:
+                st = os.stat(target)
+                started = time.perf_counter()
+                with open(target, 'rb') as f:
+                    raw = f.read()
+                doc = decode_archive(raw)
+                read_before = time.perf_counter() - started
+            except Exception:
+                report["failed"] += 1
+                continue
+
+            if (raw[:2] == GZIP_MAGIC) == bool(compact):
+                payload = raw
+            else:
+                payload = encode_archive(doc, compact)
+                ok = decode_archive(payload) == doc
+                if not ok or not _write_bytes_atomic(target, payload):
+                    report["failed"] += 1
+                    continue
+                os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+                report["converted"] += 1
+
+            started = time.perf_counter()
+            read_json_file(target)
+            report["read_seconds_after"] += time.perf_counter() - started
+            report["read_seconds_before"] += read_before
+            report["bytes_before"] += len(raw)
+            report["bytes_after"] += len(payload)
+
+    if progress:
+        progress(len(files), len(files))
+    before, after = report["bytes_before"], report["bytes_after"]
+    report["size_ratio"] = round(after / before, 3) if before else 1.0
+    rb, ra = report["read_seconds_before"], report["read_seconds_after"]
+    report["read_speedup"] = round(rb / ra, 2) if ra else 1.0
+    return report
+
+
+if __name__ == "__main__":
+    # Usage: python match_archive.py <history_folder> [--expand]
+    if len(sys.argv) < 2:
+        print("Usage: python match_archive.py <history_folder> [--expand]")
+        sys.exit(1)
+    folder = sys.argv[1]
+    to_compact = "--expand" not in sys.argv[2:]
+    result = migrate_folder(
+        folder, compact=to_compact,
+        progress=lambda done, total: print(f"\r{done}/{total}", end="", flush=True)
+    )
+    print()
+    print(f"Converted {result['converted']} of {result['files']} archive(s), "
+          f"skipped {result['skipped']}, failed {result['failed']}")
+    print(f"Size: {result['bytes_before'] / 1048576:.2f} MB -> {result['bytes_after'] / 1048576:.2f} MB "
+          f"(x{result['size_ratio']})")
+    print(f"Read time: {result['read_seconds_before']:.3f}s -> {result['read_seconds_after']:.3f}s "
+          f"({result['read_speedup']}x)")
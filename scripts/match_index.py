@@ -0,0 +1,300 @@
+"""
+match_index.py - Persistent SQLite index of archived matches.
+
+Keeps one row per Game_<id>.json (map, rounds, time, match XP and the file's
+mtime/size) so the history sidebar can page through thousands of archives
+with an indexed query instead of globbing, stat-ing and parsing them on
+every refresh.  The archive writer updates rows incrementally; a folder
+sync only re-reads archives whose mtime or size changed.
+
+Each archive's per-player match XP also feeds a materialized best_map_xp
+table (one row per player and map, holding the record game), so the Career
+tab's top XP maps are a bounded lookup rather than a history scan.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+from match_archive import (ARCHIVE_PREFIX, ARCHIVE_EXT, load_archive_summary, game_id_from_filename,
+                           folder_key as _folder_key, get_base_path)
+
+INDEX_FILE = "match_index.sqlite3"
+RESYNC_INTERVAL_SECONDS = 300
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    folder      TEXT NOT NULL,
+    game_id     TEXT NOT NULL,
+    map         TEXT NOT NULL DEFAULT '',
+    rounds      INTEGER NOT NULL DEFAULT 0,
+    time_total  INTEGER NOT NULL DEFAULT 0,
+    match_xp    INTEGER NOT NULL DEFAULT 0,
+    mtime       REAL NOT NULL DEFAULT 0,
+    size        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (folder, game_id)
+);
+CREATE INDEX IF NOT EXISTS idx_matches_recent ON matches (folder, mtime DESC);
+
+CREATE TABLE IF NOT EXISTS player_xp (
+    folder      TEXT NOT NULL,
+    game_id     TEXT NOT NULL,
+    player_id   TEXT NOT NULL,
+    map         TEXT NOT NULL,
+    xp          INTEGER NOT NULL,
+    PRIMARY KEY (folder, game_id, player_id)
+);
+CREATE INDEX IF NOT EXISTS idx_player_xp_best ON player_xp (folder, player_id, map, xp DESC);
+
+CREATE TABLE IF NOT EXISTS best_map_xp (
+    folder      TEXT NOT NULL,
+    player_id   TEXT NOT NULL,
+    map         TEXT NOT NULL,
+    game_id     TEXT NOT NULL,
+    xp          INTEGER NOT NULL,
+    PRIMARY KEY (folder, player_id, map)
+);
+"""
+
+
+def format_map_name(map_val):
+    return str(map_val or 'Unknown').replace('_', ' ').title()
+
+
+def player_match_xp(data):
+    """{ player_id: match_xp_earned } for players with XP above zero."""
+    if not data: return {}
+    players = data.get('players') or data.get('data', {}).get('players', {}) or {}
+    result = {}
+    for pid, p in players.items():
+        try:
+            xp = int((p or {}).get('match_xp_earned', 0))
+        except (TypeError, ValueError):
+            continue
+        if xp > 0:
+            result[str(pid)] = xp
+    return result
+
+
+def summarize_match(data):
+    """Pull the indexed columns out of a parsed archive."""
+    if not data:
+        return {"map": "", "rounds": 0, "time_total": 0, "match_xp": 0, "player_xp": {}}
+    game = data.get('game') or data.get('data', {}).get('game', {}) or {}
+    players = data.get('players') or data.get('data', {}).get('players', {}) or {}
+    p0 = players.get('0', next(iter(players.values()), {})) if players else {}
+    try:
+        match_xp = int(p0.get('match_xp_earned', 0)) if p0 else 0
+    except (TypeError, ValueError):
+        match_xp = 0
+    try:
+        rounds = int(game.get('rounds_total', 0))
+        time_total = int(game.get('time_total', 0))
+    except (TypeError, ValueError):
+        rounds, time_total = 0, 0
+    return {
+        "map": str(game.get('map_played') or ''),
+        "rounds": rounds,
+        "time_total": time_total,
+        "match_xp": match_xp,
+        "player_xp": player_match_xp(data),
+    }
+
+
+class MatchIndex:
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(get_base_path(), INDEX_FILE)
+        self.lock = threading.RLock()
+        self.conn = None
+        self.last_sync = {}
+        self.sync_running = set()
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # Derived data only: drop and let the next sync repopulate it
+                self.conn.executescript(
+                    "DROP TABLE IF EXISTS matches; DROP TABLE IF EXISTS player_xp; DROP TABLE IF EXISTS best_map_xp;"
+                )
+                self.conn.executescript(SCHEMA)
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self.conn.commit()
+        return self.conn
+
+    def _refresh_best_locked(self, conn, key, pairs):
+        """Recompute best_map_xp for the given (player_id, map) pairs."""
+        for player_id, map_name in pairs:
+            row = conn.execute(
+                "SELECT game_id, xp FROM player_xp WHERE folder = ? AND player_id = ? AND map = ? "
+                "ORDER BY xp DESC LIMIT 1", (key, player_id, map_name)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "INSERT OR REPLACE INTO best_map_xp (folder, player_id, map, game_id, xp) VALUES (?, ?, ?, ?, ?)",
+                    (key, player_id, map_name, row["game_id"], row["xp"])
+                )
+            else:
+                conn.execute("DELETE FROM best_map_xp WHERE folder = ? AND player_id = ? AND map = ?",
+                             (key, player_id, map_name))
+
+    def _drop_player_xp_locked(self, conn, key, game_id):
+        pairs = [(row["player_id"], row["map"]) for row in conn.execute(
+            "SELECT player_id, map FROM player_xp WHERE folder = ? AND game_id = ?", (key, game_id))]
+        conn.execute("DELETE FROM player_xp WHERE folder = ? AND game_id = ?", (key, game_id))
+        return pairs
+
+    # --- WRITES ---
+    def upsert(self, folder, archive_file, data=None, stat=None, commit=True):
+        """Index one archive. Pass data when the caller already has it parsed."""
+        try:
+            st = stat or os.stat(archive_file)
+        except OSError:
+            return False
+        if data is None:
+            # The summary header carries every indexed column
+            data = load_archive_summary(archive_file)
+        summary = summarize_match(data)
+        key, game_id = _folder_key(folder), game_id_from_filename(archive_file)
+        map_name = format_map_name(summary["map"])
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO matches (folder, game_id, map, rounds, time_total, match_xp, mtime, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, game_id, summary["map"],
+                 summary["rounds"], summary["time_total"], summary["match_xp"], st.st_mtime, st.st_size)
+            )
+            old_xp = {(row["player_id"], row["map"]): row["xp"] for row in conn.execute(
+                "SELECT player_id, map, xp FROM player_xp WHERE folder = ? AND game_id = ?", (key, game_id))}
+            new_xp = {(pid, map_name): xp for pid, xp in summary["player_xp"].items()}
+            if old_xp != new_xp:
+                pairs = set(self._drop_player_xp_locked(conn, key, game_id))
+                conn.executemany(
+                    "INSERT INTO player_xp (folder, game_id, player_id, map, xp) VALUES (?, ?, ?, ?, ?)",
+                    [(key, game_id, pid, m, xp) for (pid, m), xp in new_xp.items()]
+                )
+                self._refresh_best_locked(conn, key, pairs | set(new_xp))
+            if commit:
+                conn.commit()
+        return True
+
+    def remove(self, folder, game_id, commit=True):
+        key, game_id = _folder_key(folder), str(game_id)
+        with self.lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM matches WHERE folder = ? AND game_id = ?", (key, game_id))
+            self._refresh_best_locked(conn, key, self._drop_player_xp_locked(conn, key, game_id))
+            if commit:
+                conn.commit()
+
+    def sync_folder(self, folder):
+        """Reconcile the index with the folder, re-reading only changed archives."""
+        key = _folder_key(folder)
+        on_disk = {}
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_EXT) and entry.is_file():
+                        on_disk[game_id_from_filename(name)] = (entry.path, entry.stat())
+        except OSError:
+            return 0
+
+        with self.lock:
+            conn = self._connect()
+            known = {row["game_id"]: (row["mtime"], row["size"]) for row in
+                     conn.execute("SELECT game_id, mtime, size FROM matches WHERE folder = ?", (key,))}
+
+        changed = 0
+        for game_id, (path, st) in on_disk.items():
+            if known.get(game_id) != (st.st_mtime, st.st_size):
+                if self.upsert(folder, path, stat=st, commit=False):
+                    changed += 1
+
+        missing = [gid for gid in known if gid not in on_disk]
+        for gid in missing:
+            self.remove(folder, gid, commit=False)
+        with self.lock:
+            self._connect().commit()
+
+        self.last_sync[key] = time.time()
+        return changed + len(missing)
+
+    def ensure_synced(self, folder):
+        """Sync synchronously the first time; afterwards refresh in the background."""
+        key = _folder_key(folder)
+        last = self.last_sync.get(key)
+        if last is None:
+            self.sync_folder(folder)
+            return
+        if time.time() - last < RESYNC_INTERVAL_SECONDS or key in self.sync_running:
+            return
+        self.sync_running.add(key)
+
+        def _run():
+            try:
+                self.sync_folder(folder)
+            finally:
+                self.sync_running.discard(key)
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    # --- READS ---
+    def count(self, folder):
+        with self.lock:
+            row = self._connect().execute("SELECT COUNT(*) FROM matches WHERE folder = ?", (_folder_key(folder),)).fetchone()
+        return row[0] if row else 0
+
+    def page(self, folder, offset, limit):
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT game_id, map, rounds, time_total, match_xp, mtime FROM matches "
+                "WHERE folder = ? ORDER BY mtime DESC LIMIT ? OFFSET ?",
+                (_folder_key(folder), int(limit), int(offset))
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def latest(self, folder):
+        rows = self.page(folder, 0, 1)
+        return rows[0] if rows else None
+
+    def top_xp_maps(self, folder, player_id="0", limit=10):
+        """Best match XP per map for one player, highest first, with the record game_id."""
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT map, xp, game_id FROM best_map_xp WHERE folder = ? AND player_id = ? "
+                "ORDER BY xp DESC LIMIT ?",
+                (_folder_key(folder), str(player_id), int(limit))
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def best_on_map(self, folder, player_id, map_name):
+        """The record match for one player on one map (formatted name), or None."""
+        with self.lock:
+            row = self._connect().execute(
+                "SELECT game_id, xp FROM best_map_xp WHERE folder = ? AND player_id = ? AND map = ?",
+                (_folder_key(folder), str(player_id), format_map_name(map_name))
+            ).fetchone()
+        return dict(row) if row else None
+
+    def map_matches(self, folder, player_id, map_name, limit=20):
+        """A player's matches on one map, highest match XP first, with rounds and length."""
+        key = _folder_key(folder)
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT px.game_id, px.xp, m.rounds, m.time_total, m.mtime FROM player_xp px "
+                "JOIN matches m ON m.folder = px.folder AND m.game_id = px.game_id "
+                "WHERE px.folder = ? AND px.player_id = ? AND px.map = ? ORDER BY px.xp DESC LIMIT ?",
+                (key, str(player_id), format_map_name(map_name), int(limit))
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+# Singleton instance to be imported by bo3tracker.py
+match_index_instance = MatchIndex()
@@ -0,0 +1,152 @@
+"""
+match_lifecycle.py - Explicit match lifecycle for the live ingestion path.
+
+Tracks the active match from the game_id of each live snapshot and the gaps
+between updates:
+
+    no_match -> started -> in_progress <-> idle -> ended
+
+A match ends when a different game_id shows up, or when no update has been
+seen for END_AFTER_SECONDS.  Ending fires on_match_finalized exactly once,
+and that is where the expensive per-match work (archive compaction, index
+updates, challenge evaluation, eviction of in-memory state) hangs off.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+STATE_NO_MATCH = "no_match"
+STATE_STARTED = "started"
+STATE_IN_PROGRESS = "in_progress"
+STATE_IDLE = "idle"
+STATE_ENDED = "ended"
+
+IDLE_AFTER_SECONDS = 60
+END_AFTER_SECONDS = 20 * 60
+MAX_FINALIZED_MEMORY = 50
+
+EVENTS = ("on_match_started", "on_match_finalized", "on_state_changed")
+
+
+class MatchLifecycle:
+    def __init__(self, idle_after=IDLE_AFTER_SECONDS, end_after=END_AFTER_SECONDS):
+        self.idle_after = idle_after
+        self.end_after = end_after
+        self.lock = threading.Lock()
+        self.listeners = {event: [] for event in EVENTS}
+
+        self.game_id = None
+        self.state = STATE_NO_MATCH
+        self.started_at = None
+        self.last_update = None
+        self.updates = 0
+        self.context = {}
+        # Recently finalized game IDs, so a resumed match can be recognised
+        self.finalized = OrderedDict()
+
+    def add_listener(self, event, callback):
+        if event not in self.listeners:
+            raise ValueError(f"Unknown lifecycle event: {event}")
+        self.listeners[event].append(callback)
+
+    def _emit(self, pending):
+        for event, args in pending:
+            for callback in list(self.listeners[event]):
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"Match lifecycle {event} error: {e}")
+
+    def _set_state(self, new_state, pending):
+        if new_state == self.state:
+            return
+        old_state = self.state
+        self.state = new_state
+        pending.append(("on_state_changed", (self.game_id, old_state, new_state)))
+
+    def _finalize_locked(self, reason, pending, now):
+        if self.game_id is None or self.state == STATE_ENDED:
+            return
+        info = dict(self.context)
+        info.update({
+            "reason": reason,
+            "started_at": self.started_at,
+            "last_update": self.last_update,
+            "ended_at": now,
+            "updates": self.updates,
+        })
+        self._set_state(STATE_ENDED, pending)
+        self.finalized[self.game_id] = now
+        while len(self.finalized) > MAX_FINALIZED_MEMORY:
+            self.finalized.popitem(last=False)
+        pending.append(("on_match_finalized", (self.game_id, info)))
+
+    def observe(self, game_id, now=None, **context):
+        """Record a live update for game_id. Extra keyword args are passed to listeners."""
+        now = time.time() if now is None else now
+        game_id = str(game_id)
+        pending = []
+        with self.lock:
+            if game_id != self.game_id:
+                self._finalize_locked("superseded", pending, now)
+                resumed = game_id in self.finalized
+                self.finalized.pop(game_id, None)
+                self.game_id = game_id
+                self.state = STATE_NO_MATCH
+                self.started_at = now
+                self.updates = 0
+                self.context = dict(context)
+                self._set_state(STATE_STARTED, pending)
+                pending.append(("on_match_started", (game_id, {"resumed": resumed, **self.context})))
+            elif self.state == STATE_ENDED:
+                # Same match came back after we had given up on it
+                self.finalized.pop(game_id, None)
+                self.context.update(context)
+                self._set_state(STATE_IN_PROGRESS, pending)
+                pending.append(("on_match_started", (game_id, {"resumed": True, **self.context})))
+            else:
+                self.context.update(context)
+                self._set_state(STATE_IN_PROGRESS, pending)
+            self.last_update = now
+            self.updates += 1
+        self._emit(pending)
+        return self.state
+
+    def tick(self, now=None):
+        """Advance idle/ended detection. Call periodically, even with no updates."""
+        now = time.time() if now is None else now
+        pending = []
+        with self.lock:
+            if self.game_id is not None and self.state != STATE_ENDED and self.last_update is not None:
+                gap = now - self.last_update
+                if gap >= self.end_after:
+                    self._finalize_locked("timeout", pending, now)
+                elif gap >= self.idle_after:
+                    self._set_state(STATE_IDLE, pending)
+        self._emit(pending)
+        return self.state
+
+    def finalize_active(self, reason="manual"):
+        pending = []
+        with self.lock:
+            self._finalize_locked(reason, pending, time.time())
+        self._emit(pending)
+
+    def is_finalized(self, game_id):
+        with self.lock:
+            return str(game_id) in self.finalized
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "game_id": self.game_id,
+                "state": self.state,
+                "started_at": self.started_at,
+                "last_update": self.last_update,
+                "updates": self.updates,
+            }
+
+
+# Singleton instance to be imported by bo3tracker.py
+match_lifecycle_instance = MatchLifecycle()
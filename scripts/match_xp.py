@@ -1,16 +1,37 @@
 import os
-import csv
 import json
+import time
 import threading
+from collections import OrderedDict
+
+from startup import LazySingleton
+from xp_table import load_xp_table
+from match_archive import write_json_atomic
+
+# Cache writes are coalesced: at most one every FLUSH_INTERVAL seconds during a match
+FLUSH_INTERVAL = 5.0
+# Safety bound only; finished games are evicted by the match lifecycle
+MAX_TRACKED_GAMES = 8
 
 class MatchXPTracker:
     def __init__(self, csv_filename="xp_requirements.csv", cache_filename="match_xp_cache.json"):
-        self.level_xp_required = {}
+        self.xp_table = None
         # Memory Format: { game_id: { player_id: { prestige, level, last_cumulative_xp, total_match_xp, start_xp_required } } }
-        self.match_data = {} 
+        # Least recently updated game first
+        self.match_data = OrderedDict()
         self.last_debug = {}
         self.lock = threading.Lock()
         
+        # Write-behind state for match_xp_cache.json
+        self.dirty = False
+        self.dirty_since = None
+        self.last_flush = 0.0
+        self.flush_timer = None
+        self.persist_stats = {
+            "save_requests": 0, "flushes": 0, "failed_flushes": 0,
+            "last_flush_ms": 0.0, "last_lag_sec": 0.0, "max_lag_sec": 0.0
+        }
+        
         base_dir = os.path.dirname(os.path.abspath(__file__))
         self.csv_path = os.path.join(base_dir, csv_filename)
         self.cache_path = os.path.join(base_dir, cache_filename)
@@ -19,59 +40,35 @@ class MatchXPTracker:
         self.load_cache()
 
     def load_csv(self):
-        if not os.path.exists(self.csv_path): return
-        try:
-            with open(self.csv_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                next(reader, None)  # Skip header
-                for row in reader:
-                    if len(row) >= 4:
-                        try:
-                            level = int(row[1])
-                            xp_req = int(row[2])
-                            
-                            # Only add the level if we haven't mapped it yet!
-                            # This protects against duplicates and the 0 XP reset row.
-                            if level not in self.level_xp_required:
-                                self.level_xp_required[level] = xp_req
-                                
-                        except ValueError:
-                            # Safely skip any rows that don't have standard numbers
-                            continue
-        except Exception as e:
-            print(f"Failed to read CSV: {e}")
+        # Stage-aware table; parsed once and then served from a JSON cache in the app folder
+        self.xp_table = load_xp_table(self.csv_path)
 
-    def get_xp_required(self, level):
-        return self.level_xp_required.get(level, 0)
+    def get_xp_required(self, level, prestige=0):
+        return self.xp_table.requirement(prestige, level)
 
-    def _calculate_level_rollover_xp(self, previous_level, previous_xp, current_level, current_xp):
+    def _calculate_level_rollover_xp(self, previous_level, previous_xp, current_level, current_xp, prestige=0):
         if previous_level is None or current_level <= previous_level:
             return 0
 
-        previous_level_required = self.get_xp_required(previous_level)
+        previous_level_required = self.get_xp_required(previous_level, prestige)
         if previous_level_required <= 0:
             return 0
 
         xp_gained = max(previous_level_required - previous_xp, 0)
-
-        for skipped_level in range(previous_level + 1, current_level):
-            xp_gained += max(self.get_xp_required(skipped_level), 0)
-
+        xp_gained += self.xp_table.levels_xp(prestige, previous_level + 1, current_level - 1)
         xp_gained += current_xp
         return xp_gained
 
-    def _get_level_rollover_debug(self, previous_level, previous_xp, current_level, current_xp):
+    def _get_level_rollover_debug(self, previous_level, previous_xp, current_level, current_xp, prestige=0):
         if previous_level is None or current_level <= previous_level:
             return None
 
-        previous_level_required = self.get_xp_required(previous_level)
+        previous_level_required = self.get_xp_required(previous_level, prestige)
         if previous_level_required <= 0:
             return None
 
         remaining_previous_level = max(previous_level_required - previous_xp, 0)
-        skipped_level_xp = 0
-        for skipped_level in range(previous_level + 1, current_level):
-            skipped_level_xp += max(self.get_xp_required(skipped_level), 0)
+        skipped_level_xp = self.xp_table.levels_xp(prestige, previous_level + 1, current_level - 1)
 
         return {
             "previous_level_required": previous_level_required,
@@ -84,16 +81,53 @@ class MatchXPTracker:
         if os.path.exists(self.cache_path):
             try:
                 with open(self.cache_path, 'r', encoding='utf-8') as f:
-                    self.match_data = json.load(f)
+                    self.match_data = OrderedDict(json.load(f))
             except Exception:
                 pass
 
     def save_cache(self):
-        try:
-            with open(self.cache_path, 'w', encoding='utf-8') as f:
-                json.dump(self.match_data, f)
-        except Exception:
-            pass
+        """Mark the cache dirty (caller holds self.lock); a timer writes it at most once per FLUSH_INTERVAL."""
+        self.persist_stats["save_requests"] += 1
+        if not self.dirty:
+            self.dirty = True
+            self.dirty_since = time.monotonic()
+        if self.flush_timer is None:
+            delay = max(0.0, FLUSH_INTERVAL - (time.monotonic() - self.last_flush))
+            self.flush_timer = threading.Timer(delay, self.flush)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def flush(self):
+        """Write the cache now if it has unsaved changes. Used by the timer, at match end and on shutdown."""
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            if not self.dirty:
+                return False
+            started = time.perf_counter()
+            ok = write_json_atomic(self.cache_path, self.match_data, indent=None)
+            self.last_flush = time.monotonic()
+            stats = self.persist_stats
+            stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            if not ok:
+                # Stays dirty; the next change schedules another attempt
+                stats["failed_flushes"] += 1
+                return False
+            lag = round(self.last_flush - self.dirty_since, 3)
+            stats["flushes"] += 1
+            stats["last_lag_sec"] = lag
+            stats["max_lag_sec"] = max(stats["max_lag_sec"], lag)
+            self.dirty = False
+            self.dirty_since = None
+            return True
+
+    def get_persistence_stats(self):
+        with self.lock:
+            stats = dict(self.persist_stats)
+            stats["dirty"] = self.dirty
+            stats["pending_sec"] = round(time.monotonic() - self.dirty_since, 3) if self.dirty else 0.0
+            return stats
 
     def _set_debug_snapshot(
         self, game_id, player_id, current_prestige, current_level, current_xp,
@@ -125,25 +159,28 @@ class MatchXPTracker:
                 return None
             return dict(snapshot)
 
+    def _touch_game_locked(self, game_id):
+        """Per-game state, marked most recently used. Returns (players, created)."""
+        game = self.match_data.get(game_id)
+        if game is not None:
+            self.match_data.move_to_end(game_id)
+            return game, False
+        game = self.match_data[game_id] = {}
+        while len(self.match_data) > MAX_TRACKED_GAMES:
+            old_game_id, _ = self.match_data.popitem(last=False)
+            self.last_debug.pop(old_game_id, None)
+        return game, True
+
     def calculate_match_xp(self, game_id, player_id, current_prestige, current_level, current_xp):
         with self.lock:
-            cache_needs_saving = False
-            
-            # Clean up old games from cache
-            for old_game_id in list(self.match_data.keys()):
-                if old_game_id != game_id:
-                    del self.match_data[old_game_id]
-                    cache_needs_saving = True
-                    
-            if game_id not in self.match_data:
-                self.match_data[game_id] = {}
-                cache_needs_saving = True
+            # Other games keep their baselines; interleaved updates never reset each other
+            game, cache_needs_saving = self._touch_game_locked(game_id)
                 
-            xp_required = self.get_xp_required(current_level)
+            xp_required = self.get_xp_required(current_level, current_prestige)
                 
             # INITIALIZE NEW PLAYER
-            if player_id not in self.match_data[game_id]:
-                self.match_data[game_id][player_id] = {
+            if player_id not in game:
+                game[player_id] = {
                     "prestige": current_prestige,
                     "level": current_level,
                     "last_cumulative_xp": current_xp,
@@ -158,13 +195,13 @@ class MatchXPTracker:
                     self.save_cache()
                 return 0
 
-            p_data = self.match_data[game_id][player_id]
+            p_data = game[player_id]
             previous_prestige = p_data.get("prestige")
             previous_level = p_data.get("level", current_level)
             previous_xp = p_data.get("last_cumulative_xp", 0)
             previous_level_required = p_data.get("start_xp_required", 0)
             if previous_level_required <= 0:
-                previous_level_required = self.get_xp_required(previous_level)
+                previous_level_required = self.get_xp_required(previous_level, previous_prestige or 0)
             xp_gained = 0
             rollover_debug = None
             
@@ -172,10 +209,10 @@ class MatchXPTracker:
             if current_prestige == p_data["prestige"]:
                 if current_level > previous_level:
                     xp_gained = self._calculate_level_rollover_xp(
-                        previous_level, previous_xp, current_level, current_xp
+                        previous_level, previous_xp, current_level, current_xp, current_prestige
                     )
                     rollover_debug = self._get_level_rollover_debug(
-                        previous_level, previous_xp, current_level, current_xp
+                        previous_level, previous_xp, current_level, current_xp, current_prestige
                     )
                 else:
                     xp_gained = current_xp - previous_xp
@@ -188,7 +225,18 @@ class MatchXPTracker:
             # Scenario B: Prestige Increased Mid-Match
             elif current_prestige > p_data["prestige"]:
                 
-                if previous_xp > current_xp:
+                if (self.xp_table.has_level(previous_prestige, previous_level)
+                        and self.xp_table.has_level(current_prestige, current_level)):
+                    # Exact, including levels finished on either side of the prestige
+                    xp_gained = self.xp_table.xp_between(
+                        (previous_prestige, previous_level, previous_xp),
+                        (current_prestige, current_level, current_xp)
+                    )
+                    if xp_gained > 0:
+                        p_data["total_match_xp"] += xp_gained
+                    else:
+                        xp_gained = 0
+                elif previous_xp > current_xp:
                     # Add remaining XP to finish the last level before prestige
                     remaining_to_prestige = previous_level_required - previous_xp
                     xp_gained = remaining_to_prestige + current_xp
@@ -223,6 +271,37 @@ class MatchXPTracker:
             )
                 
             return p_data["total_match_xp"]
+
+    def seed_player(self, game_id, player_id, prestige, level, xp, total_match_xp):
+        """Restore a player's baseline for a match that is resumed after being finalized."""
+        with self.lock:
+            game, _ = self._touch_game_locked(game_id)
+            if player_id in game:
+                return False
+            game[player_id] = {
+                "prestige": prestige,
+                "level": level,
+                "last_cumulative_xp": xp,
+                "total_match_xp": total_match_xp,
+                "start_xp_required": self.get_xp_required(level, prestige)
+            }
+            self.save_cache()
+            return True
+
+    def has_game(self, game_id):
+        with self.lock:
+            return game_id in self.match_data
+
+    def evict_game(self, game_id):
+        """Drop all per-game state once the match lifecycle says it is over."""
+        with self.lock:
+            removed = self.match_data.pop(game_id, None) is not None
+            self.last_debug.pop(game_id, None)
+            if removed:
+                self.save_cache()
+        # Match end: persist now rather than waiting for the timer
+        self.flush()
+        return removed
 
 # Singleton instance to be imported by bo3tracker.py
-xp_tracker_instance = MatchXPTracker()
+xp_tracker_instance = LazySingleton("match XP tracker", MatchXPTracker)
@@ -0,0 +1,160 @@
+"""
+pace_reference.py - Reference pace curves from past matches on the same map.
+
+A reference curve is built once from an archived match's round_history and
+stored densely by round (XPM, round XP and round length), so comparing a live
+tick against it is a single index at the current round.  By default the
+reference is the player's record match on the map (match_index best_map_xp);
+a specific archived match can be chosen per map instead.
+
+Curves are built on a background thread the first time a map is asked for
+and kept in a small LRU; until one is ready the live view simply has no
+reference.
+"""
+
+import threading
+from array import array
+from collections import OrderedDict
+
+from match_archive import load_archive
+from match_index import match_index_instance, format_map_name
+from xpm_grapher import RoundSeries
+
+MAX_CACHED_CURVES = 16
+
+_MISSING = object()
+
+
+def _round_of(label):
+    """'Round 12' -> 12."""
+    try:
+        return int(str(label).rsplit(' ', 1)[-1])
+    except ValueError:
+        return None
+
+
+class ReferenceCurve:
+    def __init__(self, game_id, xp, series):
+        self.game_id = game_id
+        self.xp = xp
+        rounds = series.rounds
+        self.first_round = rounds[0] if rounds else 1
+        self.last_round = rounds[-1] if rounds else 0
+        n = max(self.last_round - self.first_round + 1, 0)
+        self.xpm = array('d', [0.0]) * n
+        self.round_xp = array('q', [0]) * n
+        self.round_time = array('q', [0]) * n
+
+        # Dense by round; a round missing from the history repeats the one before it
+        j = 0
+        for i in range(n):
+            if j < len(rounds) and rounds[j] == self.first_round + i:
+                self.xpm[i] = series.xpm[j]
+                self.round_xp[i] = series.round_xp[j]
+                self.round_time[i] = series.round_time[j]
+                j += 1
+            elif i:
+                self.xpm[i], self.round_xp[i], self.round_time[i] = self.xpm[i - 1], self.round_xp[i - 1], self.round_time[i - 1]
+
+        self._aligned_key = None
+        self._aligned = None
+
+    def at(self, current_round):
+        """(xpm, round_xp, round_seconds) of the reference at a round, or None past its end."""
+        i = int(current_round) - self.first_round
+        if 0 <= i < len(self.xpm):
+            return self.xpm[i], self.round_xp[i], self.round_time[i]
+        return None
+
+    def aligned(self, key, xpm_labels, round_xp_labels):
+        """Reference XPM, round XP and round length at each graph label (None where it has no data). Cached per key."""
+        if key is None or key != self._aligned_key:
+            def pick(values, labels):
+                out = []
+                for label in labels:
+                    r = _round_of(label)
+                    i = r - self.first_round if r is not None else -1
+                    out.append(values[i] if 0 <= i < len(values) else None)
+                return out
+            self._aligned = (pick(self.xpm, xpm_labels), pick(self.round_xp, round_xp_labels),
+                             pick(self.round_time, round_xp_labels))
+            self._aligned_key = key
+        return self._aligned
+
+
+class PaceReference:
+    def __init__(self, index=None):
+        self.index = index or match_index_instance
+        self.lock = threading.Lock()
+        # (folder, game_id, player_id) -> ReferenceCurve, least recently used first
+        self.curves = OrderedDict()
+        # (folder, player_id, map, chosen game_id, live game_id) -> reference game_id, or None if there is none
+        self.resolved = {}
+        self.loading = set()
+
+    def get(self, folder, player_id, map_name, chosen=None, exclude_game=None):
+        """The reference curve for a player on a map, or None while it is being built or if there is none."""
+        key = (folder, str(player_id), format_map_name(map_name), chosen or None, exclude_game)
+        with self.lock:
+            game_id = self.resolved.get(key, _MISSING)
+            if game_id is not _MISSING:
+                if game_id is None:
+                    return None
+                curve_key = (folder, game_id, key[1])
+                curve = self.curves.get(curve_key)
+                if curve is not None:
+                    self.curves.move_to_end(curve_key)
+                    return curve
+            if key in self.loading:
+                return None
+            self.loading.add(key)
+        threading.Thread(target=self._build, args=(key,), daemon=True).start()
+        return None
+
+    def _resolve(self, key):
+        folder, player_id, map_name, chosen, exclude_game = key
+        self.index.ensure_synced(folder)
+        if chosen:
+            rows = [r for r in self.index.map_matches(folder, player_id, map_name, 200) if r["game_id"] == chosen]
+            return rows[0] if rows else {"game_id": chosen, "xp": 0}
+        best = self.index.best_on_map(folder, player_id, map_name)
+        if best and best["game_id"] == exclude_game:
+            # The live match is already archived (reopened); compare against the next best
+            rows = [r for r in self.index.map_matches(folder, player_id, map_name, 2) if r["game_id"] != exclude_game]
+            best = rows[0] if rows else None
+        return best
+
+    def _build(self, key):
+        folder, player_id = key[0], key[1]
+        game_id, curve = None, None
+        try:
+            row = self._resolve(key)
+            if row:
+                game_id = row["game_id"]
+                curve = self.curves.get((folder, game_id, player_id))
+                if curve is None:
+                    data = load_archive(folder, game_id) or {}
+                    players = data.get('players') or data.get('data', {}).get('players', {}) or {}
+                    history = (players.get(player_id) or {}).get('round_history')
+                    if history:
+                        curve = ReferenceCurve(game_id, int(row.get("xp") or 0), RoundSeries.from_history(history))
+        except Exception as e:
+            print(f"Pace reference error: {e}")
+        finally:
+            with self.lock:
+                self.loading.discard(key)
+                self.resolved[key] = game_id if curve is not None else None
+                if curve is not None:
+                    self.curves[(folder, game_id, player_id)] = curve
+                    self.curves.move_to_end((folder, game_id, player_id))
+                    while len(self.curves) > MAX_CACHED_CURVES:
+                        self.curves.popitem(last=False)
+
+    def invalidate(self):
+        """Forget which match is the reference (a new record or a new choice); built curves are kept."""
+        with self.lock:
+            self.resolved.clear()
+
+
+# Singleton instance to be imported by bo3tracker.py
+pace_reference_instance = PaceReference()
@@ -0,0 +1,149 @@
+"""
+snapshot_diff.py - Structural differ for CurrentGame.json snapshots.
+
+Compares two parsed snapshots and reports which game fields, players,
+weapons and perks changed, with old and new values, so each live pipeline
+stage can decide for itself whether it has any work to do instead of the
+whole document being re-serialized and string-compared on every tick.
+"""
+
+XP_FIELDS = ("xp", "total_xp", "level", "prestige")
+WEAPON_FIELDS = ("weapon_data", "top5")
+PERK_FIELD = "perks"
+
+# Player-0 counters that feed the challenge engine
+CHALLENGE_PLAYER_FIELDS = (
+    "kills", "headshots", "doors_purchased", "player_points_gained", "points",
+    "melee_kills", "perks", "calculated_perks_drank",
+)
+CHALLENGE_GAME_FIELDS = ("rounds_total", "game_id")
+
+
+def _game_of(data):
+    if not data: return {}
+    return data.get('game') or data.get('data', {}).get('game', {}) or {}
+
+
+def _players_of(data):
+    if not data: return {}
+    return data.get('players') or data.get('data', {}).get('players', {}) or {}
+
+
+def _perk_set(raw_perks):
+    if isinstance(raw_perks, dict): raw_perks = list(raw_perks.values())
+    return set(x for x in (raw_perks or []) if x)
+
+
+def _diff_flat(old, new, skip=()):
+    changes = {}
+    for key, new_val in new.items():
+        if key in skip: continue
+        old_val = old.get(key)
+        if old_val != new_val:
+            changes[key] = (old_val, new_val)
+    for key, old_val in old.items():
+        if key in skip or key in new: continue
+        changes[key] = (old_val, None)
+    return changes
+
+
+class ChangeSet:
+    """Typed description of what moved between two snapshots."""
+
+    def __init__(self):
+        self.game = {}            # field -> (old, new)
+        self.players = {}         # pid -> { field -> (old, new) }
+        self.weapons = {}         # pid -> { weapon_key -> { field -> (old, new) } }
+        self.perks = {}           # pid -> (added set, removed set)
+        self.added_players = set()
+        self.removed_players = set()
+        self.first_player_id = None
+
+    def is_empty(self):
+        return not (self.game or self.players or self.weapons or self.perks
+                    or self.added_players or self.removed_players)
+
+    def game_changed(self, *fields):
+        if not fields: return bool(self.game)
+        return any(f in self.game for f in fields)
+
+    def player_changed(self, pid, *fields):
+        pid = str(pid)
+        if pid in self.added_players: return True
+        changed = self.players.get(pid, {})
+        if not fields: return bool(changed) or pid in self.weapons or pid in self.perks
+        return any(f in changed for f in fields)
+
+    def xp_changed(self, pid):
+        return self.player_changed(pid, *XP_FIELDS)
+
+    def damage_moved(self, pid):
+        """Set of weapon keys whose damage value changed for this player."""
+        weapons = self.weapons.get(str(pid), {})
+        return set(k for k, fields in weapons.items() if "damage" in fields)
+
+    def first_player_counters_changed(self):
+        if self.game_changed(*CHALLENGE_GAME_FIELDS): return True
+        if self.first_player_id is None: return False
+        return self.player_changed(self.first_player_id, *CHALLENGE_PLAYER_FIELDS)
+
+    def summary(self):
+        return {
+            "game": sorted(self.game),
+            "players": {pid: sorted(f) for pid, f in self.players.items()},
+            "weapons": {pid: sorted(w) for pid, w in self.weapons.items()},
+            "perks": {pid: {"added": sorted(a), "removed": sorted(r)} for pid, (a, r) in self.perks.items()},
+            "added_players": sorted(self.added_players),
+            "removed_players": sorted(self.removed_players),
+        }
+
+
+def diff_snapshots(old, new):
+    """
+    Compare two parsed CurrentGame.json snapshots.
+
+    old may be None (first snapshot), in which case every player counts as
+    added and every game field as changed.
+    """
+    changes = ChangeSet()
+    old_game, new_game = _game_of(old), _game_of(new)
+    old_players, new_players = _players_of(old), _players_of(new)
+
+    changes.game = _diff_flat(old_game, new_game)
+    if new_players:
+        changes.first_player_id = str(next(iter(new_players)))
+
+    for pid, p in new_players.items():
+        pid = str(pid)
+        old_p = old_players.get(pid)
+        if old_p is None:
+            changes.added_players.add(pid)
+            continue
+        if old_p is p or old_p == p:
+            continue
+
+        fields = _diff_flat(old_p, p, skip=WEAPON_FIELDS + (PERK_FIELD,))
+        if fields:
+            changes.players[pid] = fields
+
+        weapon_changes = {}
+        for source in WEAPON_FIELDS:
+            old_w, new_w = old_p.get(source) or {}, p.get(source) or {}
+            if old_w == new_w: continue
+            for key, w in new_w.items():
+                w_old = old_w.get(key) or {}
+                if w_old != w:
+                    weapon_changes.setdefault(key, {}).update(_diff_flat(w_old, w or {}))
+        if weapon_changes:
+            changes.weapons[pid] = weapon_changes
+
+        old_perks, new_perks = _perk_set(old_p.get(PERK_FIELD)), _perk_set(p.get(PERK_FIELD))
+        if old_perks != new_perks:
+            changes.perks[pid] = (new_perks - old_perks, old_perks - new_perks)
+            changes.players.setdefault(pid, {})[PERK_FIELD] = (sorted(old_perks), sorted(new_perks))
+
+    for pid in old_players:
+        if str(pid) not in new_players:
+            changes.removed_players.add(str(pid))
+
+    return changes
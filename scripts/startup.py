@@ -0,0 +1,103 @@
+"""
+startup.py - Deferred loading of disk-backed singletons and a startup profiler.
+
+LazySingleton stands in for a module-level instance whose constructor reads
+from disk.  The real object is built the first time any attribute is used,
+or ahead of time by preload_in_background(), so importing bo3tracker.py no
+longer waits on JSON files and folder scans before the window can open.
+
+startup_profiler records how long each phase took, measured from the moment
+this module was first imported.  Run bo3tracker.py with --startup-report to
+print the breakdown once the UI reports it is ready.
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.lock = threading.Lock()
+        # (name, start ms, duration ms or None for instant marks, thread name)
+        self.events = []
+
+    def _now_ms(self):
+        return (time.perf_counter() - self.t0) * 1000.0
+
+    @contextmanager
+    def phase(self, name):
+        start = self._now_ms()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.events.append((name, start, self._now_ms() - start, threading.current_thread().name))
+
+    def mark(self, name):
+        with self.lock:
+            self.events.append((name, self._now_ms(), None, threading.current_thread().name))
+
+    def get_phases(self):
+        with self.lock:
+            return [
+                {"name": n, "start_ms": round(s, 1), "duration_ms": None if d is None else round(d, 1), "thread": t}
+                for n, s, d, t in sorted(self.events, key=lambda e: e[1])
+            ]
+
+    def report(self):
+        lines = ["Startup report (ms since first import)", f"{'start':>9} {'took':>9}  phase"]
+        for p in self.get_phases():
+            took = "" if p["duration_ms"] is None else f"{p['duration_ms']:.1f}"
+            where = "" if p["thread"] == "MainThread" else f"  [{p['thread']}]"
+            lines.append(f"{p['start_ms']:>9.1f} {took:>9}  {p['name']}{where}")
+        return "\n".join(lines)
+
+
+startup_profiler = StartupProfiler()
+
+
+class LazySingleton:
+    """Proxy that constructs factory() on first attribute access (thread-safe)."""
+
+    def __init__(self, name, factory):
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_target", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def _lazy_get(self):
+        target = self._lazy_target
+        if target is None:
+            with self._lazy_lock:
+                target = self._lazy_target
+                if target is None:
+                    with startup_profiler.phase(f"load {self._lazy_name}"):
+                        target = self._lazy_factory()
+                    object.__setattr__(self, "_lazy_target", target)
+        return target
+
+    def is_loaded(self):
+        return self._lazy_target is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._lazy_get(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._lazy_get(), attr, value)
+
+
+def preload_in_background(*singletons, on_done=None):
+    """Build every LazySingleton on a daemon thread; on_done() runs afterwards."""
+    def _run():
+        for singleton in singletons:
+            try:
+                singleton._lazy_get()
+            except Exception as e:
+                print(f"Startup preload error: {e}")
+        if on_done: on_done()
+
+    t = threading.Thread(target=_run, name="startup-preload", daemon=True)
+    t.start()
+    return t
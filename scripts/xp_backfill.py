@@ -0,0 +1,223 @@
+"""
+xp_backfill.py - Reconstruct match_xp_earned for archives recorded before it existed.
+
+Each archive's summary header holds the local player's prestige, level and XP
+at the end of that match.  Ordered by archive mtime, the XP between two
+consecutive end states (from the stage-aware XPTable) is what the later match
+earned.  Archives that are missing match_xp_earned get that value written
+back, marked with match_xp_backfilled, keeping their original mtime.
+
+Headers are read in a process pool for large folders.  Progress is kept in
+a checkpoint of written archives so an interrupted backfill resumes where
+it stopped and archives that failed to write are tried again.  Pairs
+that do not give a usable delta (the first archive, unknown levels, XP going
+backwards after a prestige reset) are left alone.
+
+round_history cannot be backfilled: archives only keep the final state.
+"""
+
+import os
+import sys
+import glob
+import time
+import threading
+
+from match_archive import (ARCHIVE_PREFIX, ARCHIVE_EXT, journal_path_for, load_archive_file,
+                           load_archive_summary, is_compact_file, write_archive_atomic, write_summary,
+                           read_json_file, write_json_atomic, game_id_from_filename, folder_key, get_base_path)
+from history_rebuild import CHUNK_SIZE, PARALLEL_MIN_FILES, process_pool
+
+CHECKPOINT_FILE = "xp_backfill_checkpoint.json"
+CHECKPOINT_EVERY = 25
+
+
+def read_point(path):
+    """The first player's end state for one archive, from its summary header."""
+    try:
+        mtime = os.stat(path).st_mtime
+        summary = load_archive_summary(path)
+    except OSError:
+        return None
+    players = (summary or {}).get('players') or {}
+    if not players:
+        return None
+    p = list(players.values())[0]
+    try:
+        return {
+            "path": path,
+            "game_id": game_id_from_filename(path),
+            "mtime": mtime,
+            "prestige": int(p.get('prestige', 0)),
+            "level": int(p.get('level', 1)),
+            "xp": int(p.get('xp', p.get('total_xp', 0))),
+            "has_match_xp": 'match_xp_earned' in p,
+        }
+    except (TypeError, ValueError):
+        return None
+
+
+def read_points(files, workers=None):
+    workers = workers or os.cpu_count() or 1
+    if len(files) < PARALLEL_MIN_FILES or workers <= 1:
+        points = map(read_point, files)
+    else:
+        with process_pool(workers) as pool:
+            points = list(pool.map(read_point, files, chunksize=CHUNK_SIZE))
+    return [p for p in points if p]
+
+
+def plan_backfill(points, xp_table):
+    """[(point, match_xp)] for archives missing match XP, in chronological order."""
+    points = sorted(points, key=lambda p: p["mtime"])
+    positions = [
+        xp_table.position(p["prestige"], p["level"], p["xp"]) if xp_table.has_level(p["prestige"], p["level"]) else None
+        for p in points
+    ]
+    plan = []
+    for i in range(1, len(points)):
+        if points[i]["has_match_xp"]:
+            continue
+        before, after = positions[i - 1], positions[i]
+        if before is not None and after is not None and after >= before:
+            plan.append((points[i], after - before))
+    return plan
+
+
+def write_match_xp(path, match_xp):
+    """Store match_xp_earned on the archive's first player, keeping format and mtime."""
+    data = load_archive_file(path)
+    players = (data or {}).get('players') or (data or {}).get('data', {}).get('players', {})
+    if not players:
+        return None
+    p = list(players.values())[0]
+    if 'match_xp_earned' in p:
+        return None
+    p['match_xp_earned'] = int(match_xp)
+    p['match_xp_backfilled'] = True
+    st = os.stat(path)
+    if not write_archive_atomic(path, data, compact=is_compact_file(path)):
+        return None
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    write_summary(path, data)
+    return data
+
+
+class XPBackfill:
+    def __init__(self, checkpoint_file=None):
+        self.checkpoint_file = checkpoint_file or os.path.join(get_base_path(), CHECKPOINT_FILE)
+        self.lock = threading.Lock()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.status = {"running": False, "phase": "idle", "done": 0, "total": 0,
+                       "written": 0, "skipped": 0, "seconds": 0.0, "msg": ""}
+
+    def get_status(self):
+        with self.lock:
+            return dict(self.status)
+
+    def _update(self, **fields):
+        with self.lock:
+            self.status.update(fields)
+
+    def cancel(self):
+        self.cancel_event.set()
+        return True
+
+    # --- CHECKPOINT ---
+    def _load_checkpoint(self, folder):
+        state = read_json_file(self.checkpoint_file) or {}
+        if state.get("folder") != folder_key(folder):
+            return {}
+        return state.get("done") or {}
+
+    def _save_checkpoint(self, folder, done):
+        write_json_atomic(self.checkpoint_file, {"folder": folder_key(folder), "done": done}, indent=None)
+
+    # --- RUN ---
+    def start(self, history_path, xp_table, journal=None, match_index=None, workers=None):
+        """Start a background backfill. Returns False if one is already running."""
+        with self.lock:
+            if self.status["running"]:
+                return False
+            self.status = {"running": True, "phase": "scanning", "done": 0, "total": 0,
+                           "written": 0, "skipped": 0, "seconds": 0.0, "msg": ""}
+        self.cancel_event.clear()
+        self.thread = threading.Thread(
+            target=self._run, args=(history_path, xp_table, journal, match_index, workers), daemon=True
+        )
+        self.thread.start()
+        return True
+
+    def run(self, history_path, xp_table, journal=None, match_index=None, workers=None):
+        """Blocking backfill (used by the background thread and the command line)."""
+        started = time.perf_counter()
+        if not xp_table:
+            self._update(msg="XP table is not available; nothing was changed.")
+            return None
+        files = glob.glob(os.path.join(history_path, f"{ARCHIVE_PREFIX}*{ARCHIVE_EXT}"))
+        self._update(phase="scanning", total=len(files))
+        plan = plan_backfill(read_points(files, workers), xp_table)
+
+        done = self._load_checkpoint(history_path)
+        plan = [(point, xp) for point, xp in plan if point["game_id"] not in done]
+        self._update(phase="writing", total=len(plan), done=0)
+
+        written = skipped = 0
+        for i, (point, match_xp) in enumerate(plan):
+            if self.cancel_event.is_set():
+                break
+            lock = journal.lock if journal else threading.Lock()
+            with lock:
+                # The live match writes through the journal; leave it alone
+                if (journal and point["path"] in journal.open_matches) or os.path.exists(journal_path_for(point["path"])):
+                    skipped += 1
+                    continue
+                try:
+                    ok = write_match_xp(point["path"], match_xp) is not None
+                except Exception as e:
+                    print(f"XP backfill error: {e}")
+                    ok = False
+            if ok:
+                # Only successes are checkpointed; a failed write is retried on the next run
+                done[point["game_id"]] = match_xp
+            written += ok
+            skipped += not ok
+            if (i + 1) % CHECKPOINT_EVERY == 0:
+                self._save_checkpoint(history_path, done)
+            self._update(done=i + 1, written=written, skipped=skipped)
+        self._save_checkpoint(history_path, done)
+
+        if written and match_index is not None:
+            # Sizes changed; the fresh summary headers carry the new XP
+            match_index.sync_folder(history_path)
+
+        elapsed = time.perf_counter() - started
+        cancelled = self.cancel_event.is_set()
+        self._update(seconds=elapsed, msg=(
+            f"{'Stopped' if cancelled else 'Done'}: backfilled {written} match(es), "
+            f"skipped {skipped}, in {elapsed:.1f}s."
+        ))
+        return written
+
+    def _run(self, *args):
+        try:
+            self.run(*args)
+        except Exception as e:
+            self._update(msg=f"Backfill failed: {e}")
+        finally:
+            self._update(running=False, phase="idle")
+
+
+# Singleton instance to be imported by bo3tracker.py
+xp_backfill_instance = XPBackfill()
+
+
+if __name__ == "__main__":
+    # Usage: python xp_backfill.py <history_folder> [workers]
+    if len(sys.argv) < 2:
+        print("Usage: python xp_backfill.py <history_folder> [workers]")
+        sys.exit(1)
+    from xp_table import load_xp_table
+    table = load_xp_table(os.path.join(get_base_path(), "xp_requirements.csv"))
+    xp_backfill_instance.run(sys.argv[1], table, workers=int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    print(xp_backfill_instance.get_status()["msg"])
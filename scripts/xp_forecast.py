@@ -0,0 +1,134 @@
+"""
+xp_forecast.py - Rolling XP rates and level-up ETAs for the live match.
+
+Every snapshot feeds (round, game time, match XP) for a player.  Two sliding
+windows are kept per (game, player): the last WINDOW_SECONDS of game time and
+the last WINDOW_ROUNDS completed rounds.  Each update is O(1) amortized and a
+rate is the XP difference across its window, so forecasts can be recomputed
+on every snapshot.  Remaining XP comes from the stage-aware XPTable.
+"""
+
+import threading
+from collections import deque
+
+WINDOW_SECONDS = 300
+WINDOW_ROUNDS = 5
+
+
+class PlayerRates:
+    def __init__(self):
+        # (game seconds, cumulative match xp), oldest first; one sample may sit before the window as its anchor
+        self.samples = deque()
+        # (round, cumulative match xp at the latest sample of that round)
+        self.rounds = deque(maxlen=WINDOW_ROUNDS + 2)
+
+    def update(self, current_round, current_time, match_xp):
+        if self.samples and current_time < self.samples[-1][0]:
+            # Game clock went backwards: a different session, start over
+            self.samples.clear()
+            self.rounds.clear()
+
+        if self.samples and self.samples[-1][0] == current_time:
+            self.samples[-1] = (current_time, match_xp)
+        else:
+            self.samples.append((current_time, match_xp))
+        while len(self.samples) > 2 and self.samples[1][0] <= current_time - WINDOW_SECONDS:
+            self.samples.popleft()
+
+        if self.rounds and self.rounds[-1][0] == current_round:
+            self.rounds[-1] = (current_round, match_xp)
+        elif not self.rounds or current_round > self.rounds[-1][0]:
+            self.rounds.append((current_round, match_xp))
+
+    def xp_per_min(self):
+        if len(self.samples) < 2: return 0.0
+        (t0, xp0), (t1, xp1) = self.samples[0], self.samples[-1]
+        return max(xp1 - xp0, 0) * 60.0 / (t1 - t0) if t1 > t0 else 0.0
+
+    def xp_per_round(self):
+        if len(self.rounds) < 2: return 0.0
+        # The newest round is still in progress; measure across finished rounds once there are two
+        (r0, xp0), (r1, xp1) = self.rounds[0], self.rounds[-2 if len(self.rounds) > 2 else -1]
+        return max(xp1 - xp0, 0) / (r1 - r0) if r1 > r0 else 0.0
+
+
+def _eta(xp_needed, per_min, per_round):
+    if xp_needed is None or xp_needed < 0: return None
+    return {
+        "xp": int(xp_needed),
+        "minutes": round(xp_needed / per_min, 1) if per_min > 0 else None,
+        "rounds": round(xp_needed / per_round, 1) if per_round > 0 else None,
+    }
+
+
+def format_eta(eta):
+    """'1,234 XP · ~12m · ~3.5 rounds' for the live panel."""
+    if not eta: return "--"
+    parts = [f"{eta['xp']:,} XP"]
+    if eta["minutes"] is not None:
+        hours, mins = divmod(int(round(eta["minutes"])), 60)
+        parts.append(f"~{hours}h {mins}m" if hours else f"~{mins}m")
+    if eta["rounds"] is not None:
+        parts.append(f"~{eta['rounds']:g} rounds")
+    return " · ".join(parts)
+
+
+class XPForecaster:
+    def __init__(self):
+        # { game_id: { player_id: PlayerRates } }
+        self.players = {}
+        self.lock = threading.Lock()
+
+    def _rates(self, game_id, player_id):
+        return self.players.setdefault(game_id, {}).setdefault(player_id, PlayerRates())
+
+    def update(self, game_id, player_id, current_round, current_time, match_xp):
+        with self.lock:
+            self._rates(game_id, player_id).update(int(current_round), int(current_time), int(match_xp))
+
+    def has_player(self, game_id, player_id):
+        with self.lock:
+            return player_id in self.players.get(game_id, {})
+
+    def seed(self, game_id, player_id, round_history):
+        """Warm the windows from a stored round_history (resumed or reopened match)."""
+        with self.lock:
+            rates = self._rates(game_id, player_id)
+            for r in sorted(int(k) for k in (round_history or {})):
+                entry = round_history[str(r)] or {}
+                rates.update(r, int(entry.get("time", 0)), int(entry.get("xp", 0)))
+
+    def forecast(self, game_id, player_id, xp_table, prestige, level, xp, target_level=None):
+        """Rates plus XP/minutes/rounds to the next level, next prestige and target level."""
+        with self.lock:
+            rates = self.players.get(game_id, {}).get(player_id)
+            per_min = rates.xp_per_min() if rates else 0.0
+            per_round = rates.xp_per_round() if rates else 0.0
+        result = {
+            "xp_per_min": int(per_min),
+            "xp_per_round": int(per_round),
+            "next_level": None,
+            "next_prestige": None,
+            "target": None,
+            "target_level": target_level,
+        }
+        if not xp_table:
+            return result
+
+        here = (prestige, level, xp)
+        if xp_table.has_level(prestige, level + 1):
+            result["next_level"] = _eta(xp_table.xp_between(here, (prestige, level + 1, 0)), per_min, per_round)
+        if level <= xp_table.stage_length(prestige):
+            # Prestiging happens at the end of the stage's last level
+            result["next_prestige"] = _eta(xp_table.xp_between(here, (prestige + 1, 1, 0)), per_min, per_round)
+        if target_level and target_level > level and xp_table.has_level(prestige, target_level):
+            result["target"] = _eta(xp_table.xp_between(here, (prestige, target_level, 0)), per_min, per_round)
+        return result
+
+    def evict_game(self, game_id):
+        with self.lock:
+            return self.players.pop(game_id, None) is not None
+
+
+# Singleton instance to be imported by bo3tracker.py
+xp_forecast_instance = XPForecaster()
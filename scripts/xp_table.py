@@ -0,0 +1,194 @@
+"""
+xp_table.py - Stage-aware rank XP table with O(1) lookups.
+
+xp_requirements.csv lists every (Stage, Level) with the XP that level takes.
+Prestige stages ("Prestige 1".."Prestige 20") cover levels 1-90 and the
+Master Prestige stage continues from level 91.  Each stage is kept as an
+array of per-level requirements plus a running prefix sum, so the XP between
+any two (prestige, level, xp) points - across level-ups and prestiges - is a
+subtraction of two positions.
+
+The parsed requirements are cached as JSON in the app's data folder and
+reused while the CSV's mtime and size are unchanged.
+
+Note: a level's requirement is its "Total XP in Current Stage" value, not a
+difference of "Global Cumulative XP".  That value is the denominator the game
+shows for progress inside a level (P20 L355 reads 6,208,790 / 6,778,400), and
+with it the verified P20 L355 -> L356 gain of 1,355,960 (569,610 left in L355
+plus 786,350 into L356) comes out right.  The prefix sums here are running
+sums of that column, so they do not match the global column.
+"""
+
+import os
+import re
+import csv
+from array import array
+
+from match_archive import read_json_file, write_json_atomic, get_base_path
+
+CACHE_FILE = "xp_table_cache.json"
+CACHE_VERSION = 2
+
+_PRESTIGE_STAGE = re.compile(r"^\s*Prestige\s+(\d+)\s*$", re.IGNORECASE)
+
+
+def _prefix(requirements):
+    sums = array('q', [0])
+    total = 0
+    for req in requirements:
+        total += req
+        sums.append(total)
+    return sums
+
+
+class XPTable:
+    def __init__(self, prestige_stages=None, extension_first_level=0, extension=None):
+        # prestige number -> array of requirements for levels 1..n
+        self.prestige_req = {}
+        self.prestige_prefix = {}
+        for number, reqs in (prestige_stages or {}).items():
+            self.prestige_req[number] = array('q', reqs)
+            self.prestige_prefix[number] = _prefix(self.prestige_req[number])
+        self.stage_numbers = sorted(self.prestige_req)
+
+        # Levels past the prestige stages (Master Prestige), starting at extension_first_level
+        self.ext_first = extension_first_level
+        self.ext_req = array('q', extension or [])
+        self.ext_prefix = _prefix(self.ext_req)
+
+        # Where each prestige's run of levels starts on one global XP axis
+        self.run_start = array('q', [0])
+        for p in range(max(self.stage_numbers, default=0)):
+            self.run_start.append(self.run_start[-1] + self._run_total(p))
+
+    def __bool__(self):
+        return bool(self.prestige_req) or bool(self.ext_req)
+
+    # --- STAGES ---
+    def _stage_for(self, prestige):
+        """Prestige 0 plays the first stage's levels; prestiges past the table reuse the last one."""
+        if not self.stage_numbers: return None
+        if prestige in self.prestige_req: return prestige
+        return self.stage_numbers[0] if prestige < self.stage_numbers[0] else self.stage_numbers[-1]
+
+    def _run_total(self, prestige):
+        stage = self._stage_for(prestige)
+        return self.prestige_prefix[stage][-1] if stage is not None else 0
+
+    def _start_of_run(self, prestige):
+        prestige = max(int(prestige), 0)
+        if prestige < len(self.run_start):
+            return self.run_start[prestige]
+        last = len(self.run_start) - 1
+        return self.run_start[last] + (prestige - last) * self._run_total(last)
+
+    # --- LOOKUPS ---
+    def requirement(self, prestige, level):
+        """XP the given level takes at the given prestige (0 if the level is unknown)."""
+        stage = self._stage_for(prestige)
+        if stage is not None and 1 <= level <= len(self.prestige_req[stage]):
+            return self.prestige_req[stage][level - 1]
+        offset = level - self.ext_first
+        if self.ext_req and 0 <= offset < len(self.ext_req):
+            return self.ext_req[offset]
+        return 0
+
+    def has_level(self, prestige, level):
+        return self.requirement(prestige, level) > 0
+
+    def position(self, prestige, level, xp=0):
+        """Global XP at (prestige, level) plus xp into that level."""
+        base = self._start_of_run(prestige)
+        stage = self._stage_for(prestige)
+        stage_len = len(self.prestige_req[stage]) if stage is not None else 0
+        if level <= stage_len:
+            return base + self.prestige_prefix[stage][max(level, 1) - 1] + xp
+        base += self.prestige_prefix[stage][-1] if stage is not None else 0
+        offset = min(max(level - self.ext_first, 0), len(self.ext_req))
+        return base + self.ext_prefix[offset] + xp
+
+    def xp_between(self, start, end):
+        """XP from start to end, each a (prestige, level, xp) tuple."""
+        return self.position(*end) - self.position(*start)
+
+    def levels_xp(self, prestige, first_level, last_level):
+        """Sum of requirements for levels first_level..last_level inclusive."""
+        if last_level < first_level: return 0
+        return self.position(prestige, last_level + 1) - self.position(prestige, first_level)
+
+    def stage_length(self, prestige):
+        """Number of levels in the prestige stage (the level a prestige happens at)."""
+        stage = self._stage_for(prestige)
+        return len(self.prestige_req[stage]) if stage is not None else 0
+
+    # --- LOADING ---
+    @classmethod
+    def from_csv(cls, csv_path):
+        """Parse xp_requirements.csv: Stage, Level, Total XP in Current Stage, Global Cumulative XP."""
+        stages, extension = {}, {}
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)  # Skip header
+            for row in reader:
+                if len(row) < 3: continue
+                try:
+                    level, xp_req = int(row[1]), int(row[2])
+                except ValueError:
+                    continue
+                if xp_req <= 0: continue
+                match = _PRESTIGE_STAGE.match(row[0])
+                target = stages.setdefault(int(match.group(1)), {}) if match else extension
+                target.setdefault(level, xp_req)
+
+        prestige_stages = {}
+        for number, levels in stages.items():
+            # A stage is its contiguous run of levels from 1
+            reqs, level = [], 1
+            while level in levels:
+                reqs.append(levels[level])
+                level += 1
+            prestige_stages[number] = reqs
+
+        ext_first = min(extension) if extension else 0
+        ext_reqs, level = [], ext_first
+        while level in extension:
+            ext_reqs.append(extension[level])
+            level += 1
+        return cls(prestige_stages, ext_first, ext_reqs)
+
+    def _state(self):
+        return {
+            "prestige_req": {str(number): reqs.tolist() for number, reqs in self.prestige_req.items()},
+            "ext_first": self.ext_first,
+            "ext_req": self.ext_req.tolist(),
+        }
+
+    @classmethod
+    def _from_state(cls, state):
+        stages = {int(number): reqs for number, reqs in state["prestige_req"].items()}
+        return cls(stages, int(state["ext_first"]), state["ext_req"])
+
+
+def load_xp_table(csv_path, cache_file=None):
+    """XPTable for csv_path, from the cache when it is still fresh. Empty if the CSV is missing."""
+    try:
+        st = os.stat(csv_path)
+    except OSError:
+        return XPTable()
+    stamp = [CACHE_VERSION, os.path.normcase(os.path.abspath(csv_path)), st.st_mtime, st.st_size]
+    cache_file = cache_file or os.path.join(get_base_path(), CACHE_FILE)
+
+    cached = read_json_file(cache_file)
+    if isinstance(cached, dict) and cached.get("stamp") == stamp:
+        try:
+            return XPTable._from_state(cached["table"])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    try:
+        table = XPTable.from_csv(csv_path)
+    except Exception as e:
+        print(f"Failed to read CSV: {e}")
+        return XPTable()
+    write_json_atomic(cache_file, {"stamp": stamp, "table": table._state()}, indent=None)
+    return table
@@ -1,57 +1,411 @@
 import json
 import os
-import sys
+import time
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 
-# Helper to get the correct path whether running as a .py script or compiled .exe
-def get_base_path():
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(sys.executable)
-    return os.path.dirname(os.path.abspath(__file__))
+from startup import LazySingleton
+from match_archive import write_json_atomic, get_base_path
+
+MEMORY_DIR = "xpm_graph_memory"
+LEGACY_MEMORY_FILE = "xpm_graph_memory.json"
+# The active match plus a few predecessors whose finalize has not run yet
+MAX_RETAINED_GAMES = 3
+# Graph memory writes are coalesced to at most one per game every FLUSH_INTERVAL seconds
+FLUSH_INTERVAL = 5.0
+# Most points a graph payload carries; longer series are downsampled with LTTB
+GRAPH_MAX_POINTS = 150
+# Rounds covered by the rolling XPM metric
+ROLLING_ROUNDS = 5
+
+def _memory_filename(game_id):
+    return str(game_id).replace(":", "_").replace("|", "_").replace("/", "_").replace("\\", "_") + ".json"
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
+
+def lttb_indices(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of at most threshold points that
+    keep the visual shape of (xs, ys).  First and last points are always kept.
+    """
+    n = len(xs)
+    if threshold >= n or n <= 2:
+        return list(range(n))
+    if threshold < 3:
+        return [0, n - 1][:max(threshold, 1)]
+
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        count = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / count
+        avg_y = sum(ys[avg_start:avg_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = int(i * every) + 1, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+class RoundSeries:
+    """One player's live graph series: parallel arrays kept sorted by round."""
+
+    def __init__(self):
+        self.rounds = array('l')
+        self.xp = array('q')
+        self.time = array('q')
+        self.zpm = array('d')
+        # Derived per round, same rules as generate_graph_data / generate_xp_per_round_data
+        self.xpm = array('q')
+        self.round_xp = array('q')
+        # Derived metrics: seconds the round took, XPM over the last ROLLING_ROUNDS rounds,
+        # XP per zombie killed that round (kills estimated from ZPM x time), change in round XP
+        self.round_time = array('q')
+        self.rolling_xpm = array('q')
+        self.xp_per_zombie = array('d')
+        self.round_xp_change = array('q')
+        self.labels = []
+        # Bumped on every change; callers compare it to skip unchanged series
+        self.version = 0
+        self._payloads = None
+        self._payload_version = -1
+        self._query_key = None
+        self._query_result = None
+        self._metrics = None
+        self._metrics_version = -1
+
+    def _arrays(self):
+        return (self.xp, self.time, self.zpm, self.xpm, self.round_xp,
+                self.round_time, self.rolling_xpm, self.xp_per_zombie, self.round_xp_change)
+
+    @classmethod
+    def from_history(cls, round_history):
+        series = cls()
+        for r in sorted(int(k) for k in (round_history or {})):
+            entry = round_history[str(r)] or {}
+            series.set_round(r, entry.get("xp", 0), entry.get("time", 0), entry.get("zpm", 0))
+        return series
+
+    def _derive(self, i):
+        """Recompute slot i from the raw arrays and the derived slots before it."""
+        t = self.time[i]
+        self.xpm[i] = int(self.xp[i] / (t / 60.0)) if t > 0 else 0
+        prev_xp, prev_time = (self.xp[i - 1], self.time[i - 1]) if i > 0 else (0, 0)
+        gained = self.xp[i] - prev_xp
+        self.round_xp[i] = gained if gained > 0 else 0
+
+        self.round_time[i] = max(t - prev_time, 0)
+        j = i - ROLLING_ROUNDS
+        window_xp = self.xp[i] - (self.xp[j] if j >= 0 else 0)
+        window_time = t - (self.time[j] if j >= 0 else 0)
+        self.rolling_xpm[i] = int(window_xp * 60 / window_time) if window_xp > 0 and window_time > 0 else 0
+        kills = (self.zpm[i] * t - (self.zpm[i - 1] * prev_time if i > 0 else 0)) / 60.0
+        self.xp_per_zombie[i] = round(self.round_xp[i] / kills, 1) if kills >= 1 else 0.0
+        self.round_xp_change[i] = self.round_xp[i] - self.round_xp[i - 1] if i > 0 else 0
+
+    def set_round(self, current_round, xp, current_time, zpm=0):
+        """Overwrite or append a round: O(1) for the newest round, O(n) only for an out-of-order one."""
+        r, xp, t, zpm = int(current_round), _to_int(xp), _to_int(current_time), _to_float(zpm)
+        n = len(self.rounds)
+        if n and r == self.rounds[-1]:
+            i = n - 1
+            if self.xp[i] == xp and self.time[i] == t and self.zpm[i] == zpm:
+                return False
+        elif not n or r > self.rounds[-1]:
+            i = n
+            self.rounds.append(r)
+            for arr in self._arrays():
+                arr.append(0)
+            self.labels.append(f"Round {r}")
+        else:
+            i = bisect_left(self.rounds, r)
+            if self.rounds[i] != r:
+                self.rounds.insert(i, r)
+                for arr in self._arrays():
+                    arr.insert(i, 0)
+                self.labels.insert(i, f"Round {r}")
+        self.xp[i], self.time[i], self.zpm[i] = xp, t, zpm
+        # Later rounds measure from this one: the next for deltas, up to ROLLING_ROUNDS ahead for the rolling XPM
+        for j in range(i, min(i + ROLLING_ROUNDS + 1, len(self.rounds))):
+            self._derive(j)
+        self.version += 1
+        return True
+
+    def payloads(self):
+        """(xpm, round_xp, zpm) payloads in the generate_* shape, rebuilt only when the series changed."""
+        if self._payload_version != self.version:
+            labels = list(self.labels)
+            self._payloads = (
+                {"labels": labels, "data": self.xpm.tolist()},
+                {"labels": labels, "data": self.round_xp.tolist(), "round_time": self.round_time.tolist()},
+                {"labels": labels, "data": self.zpm.tolist()},
+            )
+            self._payload_version = self.version
+        return self._payloads
+
+    def query(self, max_points=None, round_from=None, round_to=None):
+        """
+        (xpm, round_xp, zpm) payloads for rounds round_from..round_to, each at
+        most max_points long.  XPM and ZPM share the points LTTB keeps on the
+        XPM curve (the ZPM overlay is drawn on the XPM chart); round XP is
+        downsampled on its own and carries each kept round's length as
+        round_time.  The last answer is cached per version.
+        """
+        key = (self.version, max_points, round_from, round_to)
+        if key == self._query_key:
+            return self._query_result
+        lo = bisect_left(self.rounds, round_from) if round_from is not None else 0
+        hi = bisect_right(self.rounds, round_to) if round_to is not None else len(self.rounds)
+
+        if lo == 0 and hi == len(self.rounds) and (not max_points or max_points >= hi):
+            result = self.payloads()
+        else:
+            rounds = self.rounds[lo:hi]
+            labels, xpm, round_xp, zpm = self.labels[lo:hi], self.xpm[lo:hi], self.round_xp[lo:hi], self.zpm[lo:hi]
+            round_time = self.round_time[lo:hi]
+            line = lttb_indices(rounds, xpm, max_points) if max_points else range(len(rounds))
+            bars = lttb_indices(rounds, round_xp, max_points) if max_points else range(len(rounds))
+            line_labels = [labels[i] for i in line]
+            result = (
+                {"labels": line_labels, "data": [xpm[i] for i in line]},
+                {"labels": [labels[i] for i in bars], "data": [round_xp[i] for i in bars],
+                 "round_time": [round_time[i] for i in bars]},
+                {"labels": line_labels, "data": [zpm[i] for i in line]},
+            )
+        self._query_key, self._query_result = key, result
+        return result
+
+    def metrics(self, round_from=None, round_to=None):
+        """Derived per-round metrics as parallel lists, for rounds round_from..round_to."""
+        if round_from is None and round_to is None and self._metrics_version == self.version:
+            return self._metrics
+        lo = bisect_left(self.rounds, round_from) if round_from is not None else 0
+        hi = bisect_right(self.rounds, round_to) if round_to is not None else len(self.rounds)
+        result = {
+            "rounds": self.rounds[lo:hi].tolist(),
+            "round_time": self.round_time[lo:hi].tolist(),
+            "rolling_xpm": self.rolling_xpm[lo:hi].tolist(),
+            "xp_per_zombie": self.xp_per_zombie[lo:hi].tolist(),
+            "round_xp_change": self.round_xp_change[lo:hi].tolist(),
+            "rolling_rounds": ROLLING_ROUNDS,
+        }
+        if round_from is None and round_to is None:
+            self._metrics, self._metrics_version = result, self.version
+        return result
 
 class XPMGrapher:
     def __init__(self):
-        # Define where the graph memory file will be saved
-        self.memory_file = os.path.join(get_base_path(), "xpm_graph_memory.json")
-        # Load existing memory from previous sessions, or start fresh
+        # One graph memory file per game, in this folder
+        self.memory_dir = os.path.join(get_base_path(), MEMORY_DIR)
+        self.legacy_file = os.path.join(get_base_path(), LEGACY_MEMORY_FILE)
+        self.lock = threading.Lock()
+        # Serializes flushes so an older snapshot never lands after a newer one; file I/O runs outside self.lock
+        self.flush_lock = threading.Lock()
+        self.dirty = set()
+        self.flush_timer = None
+        self.last_flush = 0.0
+        # { (game_id, player_id): RoundSeries }, built on first use
+        self.series = {}
+        # { game_id: { player_id: round_history } }, least recently updated game first
         self.live_history = self._load_memory()
 
+    def _memory_path(self, game_id):
+        return os.path.join(self.memory_dir, _memory_filename(game_id))
+
     def _load_memory(self):
+        entries = []
         try:
-            if os.path.exists(self.memory_file):
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
+            os.makedirs(self.memory_dir, exist_ok=True)
+            with os.scandir(self.memory_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json") or not entry.is_file():
+                        continue
+                    try:
+                        with open(entry.path, 'r', encoding='utf-8') as f:
+                            doc = json.load(f)
+                        entries.append((entry.stat().st_mtime, str(doc["game_id"]), doc.get("players") or {}))
+                    except Exception as e:
+                        print(f"Graph memory load error: {e}")
+        except OSError as e:
             print(f"Graph memory load error: {e}")
-        return {}
 
-    def _save_memory(self):
+        history = OrderedDict()
+        for _, game_id, players in sorted(entries, key=lambda e: e[0]):
+            history[game_id] = players
+
+        # One-time split of the old single-file memory
+        migrating = os.path.exists(self.legacy_file)
+        if migrating:
+            try:
+                with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+                # Its games are older than any per-game file and keep their own order
+                older = OrderedDict((g, p) for g, p in (legacy or {}).items() if g not in history)
+                self.dirty.update(older)
+                older.update(history)
+                history = older
+            except Exception as e:
+                migrating = False
+                print(f"Graph memory load error: {e}")
+
+        self.live_history = history
+        self._trim_locked()
+        if self.dirty:
+            self.flush()
+        # Only once every migrated game has its own file; otherwise the next start migrates again
+        if migrating and not self.dirty:
+            try:
+                os.remove(self.legacy_file)
+            except OSError as e:
+                print(f"Graph memory load error: {e}")
+        return history
+
+    def _drop_game_locked(self, game_id):
+        for key in [k for k in self.series if k[0] == game_id]:
+            del self.series[key]
+        self.dirty.discard(game_id)
+        removed = self.live_history.pop(game_id, None) is not None
         try:
-            with open(self.memory_file, 'w', encoding='utf-8') as f:
-                json.dump(self.live_history, f, indent=4)
-        except Exception as e:
-            print(f"Graph memory save error: {e}")
+            os.remove(self._memory_path(game_id))
+        except OSError:
+            pass
+        return removed
+
+    def _trim_locked(self):
+        while len(self.live_history) > MAX_RETAINED_GAMES:
+            self._drop_game_locked(next(iter(self.live_history)))
+
+    def _save_memory(self, game_id):
+        """Mark one game's memory dirty (caller holds self.lock); a timer writes it at most once per FLUSH_INTERVAL."""
+        self.dirty.add(game_id)
+        if self.flush_timer is None:
+            delay = max(0.0, FLUSH_INTERVAL - (time.monotonic() - self.last_flush))
+            self.flush_timer = threading.Timer(delay, self.flush)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+
+    def _take_dirty_locked(self):
+        """Copy out every dirty game's memory and clear the dirty set."""
+        pending = []
+        for game_id in self.dirty:
+            players = self.live_history.get(game_id)
+            if players is not None:
+                # Round entries are replaced, never mutated, so two levels are enough
+                pending.append((game_id, {pid: dict(rounds) for pid, rounds in players.items()}))
+        self.dirty.clear()
+        return pending
+
+    def flush(self):
+        """Write every dirty game's memory now (timer, shutdown). Returns how many were written."""
+        with self.flush_lock:
+            with self.lock:
+                if self.flush_timer is not None:
+                    self.flush_timer.cancel()
+                    self.flush_timer = None
+                pending = self._take_dirty_locked()
 
+            failed = []
+            for game_id, players in pending:
+                if not write_json_atomic(self._memory_path(game_id), {"game_id": game_id, "players": players}, indent=None):
+                    print(f"Graph memory save error: {game_id}")
+                    failed.append(game_id)
+
+            with self.lock:
+                self.last_flush = time.monotonic()
+                for game_id, _ in pending:
+                    if game_id not in self.live_history:
+                        # Evicted while its file was being written
+                        try:
+                            os.remove(self._memory_path(game_id))
+                        except OSError:
+                            pass
+                    elif game_id in failed:
+                        self.dirty.add(game_id)
+            return len(pending) - len(failed)
+
+    def _series_locked(self, game_id, player_id):
+        key = (game_id, player_id)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = RoundSeries.from_history(self.live_history.get(game_id, {}).get(player_id))
+        return series
+
+    def get_series(self, game_id, player_id):
+        """The live RoundSeries for a player, or None if this game has no graph memory."""
+        with self.lock:
+            if player_id not in self.live_history.get(game_id, {}):
+                return None
+            return self._series_locked(game_id, player_id)
+
+    def get_graph_payloads(self, game_id, player_id, max_points=None, round_from=None, round_to=None):
+        """(version, xpm, round_xp, zpm) from the live series, downsampled and windowed, or None."""
+        with self.lock:
+            if player_id not in self.live_history.get(game_id, {}):
+                return None
+            series = self._series_locked(game_id, player_id)
+            return (series.version,) + series.query(max_points, round_from, round_to)
+
+    def query_history(self, round_history, max_points=None, round_from=None, round_to=None):
+        """(xpm, round_xp, zpm) for a stored round_history (archived matches), downsampled and windowed."""
+        return RoundSeries.from_history(round_history).query(max_points, round_from, round_to)
+
+    def get_metrics(self, game_id, player_id, round_from=None, round_to=None):
+        """Derived per-round metrics from the live series, or None."""
+        with self.lock:
+            if player_id not in self.live_history.get(game_id, {}):
+                return None
+            return self._series_locked(game_id, player_id).metrics(round_from, round_to)
+
+    def metrics_from_history(self, round_history, round_from=None, round_to=None):
+        """Derived per-round metrics for a stored round_history (archived matches)."""
+        return RoundSeries.from_history(round_history).metrics(round_from, round_to)
+
     def update_live_data(self, game_id, player_id, current_round, current_time, match_xp, zpm=0):
-        # Initialize memory if missing
-        if game_id not in self.live_history:
-            self.live_history[game_id] = {}
-        if player_id not in self.live_history[game_id]:
-            self.live_history[game_id][player_id] = {}
+        with self.lock:
+            # Initialize memory if missing
+            if game_id not in self.live_history:
+                self.live_history[game_id] = {}
+                self._trim_locked()
+            self.live_history.move_to_end(game_id)
+            if player_id not in self.live_history[game_id]:
+                self.live_history[game_id][player_id] = {}
+                
+            r_str = str(current_round)
             
-        r_str = str(current_round)
-        
-        # Continuously overwrite the current round with the latest stats.
-        self.live_history[game_id][player_id][r_str] = {
-            "xp": match_xp,
-            "time": current_time,
-            "zpm": zpm
-        }
-        
-        # --- NEW: Save to disk every time the game updates ---
-        self._save_memory()
-        # -----------------------------------------------------
-        
-        return self.live_history[game_id][player_id]
+            # Continuously overwrite the current round with the latest stats.
+            self.live_history[game_id][player_id][r_str] = {
+                "xp": match_xp,
+                "time": current_time,
+                "zpm": zpm
+            }
+            changed = self._series_locked(game_id, player_id).set_round(current_round, match_xp, current_time, zpm)
+            
+            # Debounced write of this game's memory file only
+            if changed:
+                self._save_memory(game_id)
+            
+            return self.live_history[game_id][player_id]
 
     def generate_graph_data(self, player_round_history):
         if not player_round_history:
@@ -135,5 +489,23 @@ class XPMGrapher:
 
         return {"labels": labels, "data": data}
 
+    def restore_history(self, game_id, player_id, round_history):
+        # Re-seed a resumed match from the round_history stored in its archive
+        if not round_history:
+            return
+        with self.lock:
+            game = self.live_history.setdefault(game_id, {})
+            self.live_history.move_to_end(game_id)
+            if player_id not in game:
+                game[player_id] = dict(round_history)
+                self.series.pop((game_id, player_id), None)
+                self._save_memory(game_id)
+            self._trim_locked()
+
+    def evict_game(self, game_id):
+        # Called after the archive is compacted: its round_history lives there from now on
+        with self.lock:
+            return self._drop_game_locked(game_id)
+
 # Singleton instance to be imported
-xpm_grapher_instance = XPMGrapher()
+xpm_grapher_instance = LazySingleton("XPM grapher", XPMGrapher)